@@ -1,40 +1,59 @@
-/** 8 bit 2s complement adder or subtractor
+/** 2s complement adder or subtractor, 8 bits wide by default
  */
 
 module alu
+  #(
+    parameter DATA_WIDTH = 8
+    )
   (
-   input [7:0]  i_a,
-   input [7:0]  i_b,
+   input        i_clock,
+   input [DATA_WIDTH-1:0]  i_a,
+   input [DATA_WIDTH-1:0]  i_b,
    input        i_subtract, // 0: ADD, 1: SUBTRACT
    input        i_send_result,
    output       o_flag_overflow,
    output       o_flag_zero,
-   output [7:0] o_bus
+   output [DATA_WIDTH-1:0] o_bus
    );
 
-   reg [7:0]    result;
+   // The operands as the clock cycle began. Register A loads the result
+   // in the same cycle the ALU sends it, so the sum must not follow A:
+   reg [DATA_WIDTH-1:0] a = 0;
+   reg [DATA_WIDTH-1:0] b = 0;
+   wire [DATA_WIDTH-1:0] sum = i_subtract ? (a - b) : (a + b);
+   // The last result sent to the bus, and its flags:
+   reg [DATA_WIDTH-1:0] result = 0;
    reg          overflow_flag = 0;
-   reg          zero_flag = 0;   
-   
+   reg          zero_flag = 0;
+
    assign o_flag_overflow = overflow_flag;
    assign o_flag_zero = zero_flag;
-   assign o_bus = i_send_result ? result : 8'bzzzzzzzz;
-   
-   always @(posedge i_send_result) begin
-      // tri-state output:
-      result = i_subtract ? (i_a - i_b) : (i_a + i_b);
-      
-      // Two's complement overflow detection rules:
-      //   - If the sum of two positive numbers yields a negative result, the sum has overflowed.
-      //   - If the sum of two negative numbers yields a positive result, the sum has overflowed.
-      //   - Otherwise, the sum has not overflowed.
-      overflow_flag <= ((!i_subtract && !i_a[7] && !i_b[7] && result[7]) || 
-                        (!i_subtract && i_a[7] && i_b[7] && !result[7]) ||
-                        (i_subtract && !i_a[7] && i_b[7] && !result[7]) ||
-                        (i_subtract && i_a[7] && !i_b[7] && result[7])) ? 1 : 0;
+   // tri-state output:
+   assign o_bus = i_send_result ? sum : {DATA_WIDTH{1'bz}};
 
-      zero_flag <= (result == 8'b00000000) ? 1 : 0;
+   always @(posedge i_clock) begin
+      a <= i_a;
+      b <= i_b;
    end
-   
-endmodule // adder_subtractor
 
+   // The flags are latched on the falling edge, once the controller's
+   // control word (and so i_subtract) has settled:
+   always @(negedge i_clock) begin
+      if(i_send_result) begin
+         result <= sum;
+         // Two's complement overflow detection rules:
+         //   - If the sum of two positive numbers yields a negative result, the sum has overflowed.
+         //   - If the sum of two negative numbers yields a positive result, the sum has overflowed.
+         //   - Otherwise, the sum has not overflowed.
+         // Subtracting adds the negated b, so a positive minus a negative
+         // number overflows to a negative result, and the reverse:
+         overflow_flag <= ((!i_subtract && !a[DATA_WIDTH-1] && !b[DATA_WIDTH-1] && sum[DATA_WIDTH-1]) ||
+                           (!i_subtract && a[DATA_WIDTH-1] && b[DATA_WIDTH-1] && !sum[DATA_WIDTH-1]) ||
+                           (i_subtract && !a[DATA_WIDTH-1] && b[DATA_WIDTH-1] && sum[DATA_WIDTH-1]) ||
+                           (i_subtract && a[DATA_WIDTH-1] && !b[DATA_WIDTH-1] && !sum[DATA_WIDTH-1])) ? 1 : 0;
+
+         zero_flag <= (sum == 0) ? 1 : 0;
+      end
+   end
+
+endmodule // adder_subtractor
@@ -1,8 +1,17 @@
+import os
+import random
+import time
 import cocotb
+from lib import bench
+import numpy as np
+from cocotb.triggers import Timer
 from lib.util import assertions
 from lib.cycle import clock, wait, reset
+from lib.model import alu
+from lib.testbench import Checker, Driver, Edges, Monitor
 
 @cocotb.test()
+@bench.measure
 def alu_test(dut):
 
     def assert_o_bus(value, error_msg='wrong data'):
@@ -18,6 +27,7 @@ def alu_test(dut):
         assertions.assertEqual(dut.o_flag_zero.value.binstr, '1' if zero else '0', error_msg)
 
     def reset_input():
+        dut.i_clock = 0
         dut.i_a = 0
         dut.i_b = 0
         dut.i_subtract = 0
@@ -28,11 +38,12 @@ def alu_test(dut):
     yield from reset_input()
     assert_o_bus('zzzzzzzz', 'Output should default disabled')    
 
-    ### Test add
+    ### Test add: the operands are taken on the rising edge, the flags
+    ### on the falling edge
     dut.i_a = 22
     dut.i_b = 42
     dut.i_send_result = 1
-    yield from wait()
+    yield from clock(dut)
     assert_o_bus('01000000', '22 + 42 = 64')
     assert_overflow(False)
     assert_zero(False)
@@ -43,7 +54,7 @@ def alu_test(dut):
     dut.i_b = 30
     dut.i_subtract = 1
     dut.i_send_result = 1
-    yield from wait()
+    yield from clock(dut)
     assert_o_bus('00000100', '34 - 30 = 4')
     assert_overflow(False)
     assert_zero(False)
@@ -54,7 +65,7 @@ def alu_test(dut):
     dut.i_b = 56
     dut.i_subtract = 1
     dut.i_send_result = 1
-    yield from wait()    
+    yield from clock(dut)
     assert_o_bus('11100101', '29 - 56 = -27')
     assert_overflow(False)
     assert_zero(False)
@@ -64,7 +75,7 @@ def alu_test(dut):
     dut.i_a = 127
     dut.i_b = 127
     dut.i_send_result = 1
-    yield from wait()
+    yield from clock(dut)
     assert_o_bus('11111110', '127 + 127 =  -2 with overflow')
     assert_overflow()
     assert_zero(False)
@@ -74,7 +85,7 @@ def alu_test(dut):
     dut.i_a = -2
     dut.i_b = 2
     dut.i_send_result = 1
-    yield from wait()
+    yield from clock(dut)
     assert_o_bus('00000000','-2 + 2 = 0')
     assert_zero()
     
@@ -82,3 +93,101 @@ def alu_test(dut):
     dut.i_send_result = 0
     yield from wait()
     assert_o_bus('zzzzzzzz', 'Should disconnect from bus')
+
+@cocotb.test(skip=not os.environ.get('ALU_SWEEP'))
+@bench.measure
+def alu_sweep(dut):
+    """Check every operand pair for add and subtract (run with ALU_SWEEP=1)"""
+    # All 2 x 256 x 256 vectors, and their expected outputs in one pass:
+    subtract, a, b = [x.ravel() for x in np.meshgrid(
+        np.arange(2), np.arange(256), np.arange(256), indexing='ij')]
+    expected = np.stack(alu(a, b, subtract))
+
+    # Resolve handles once, and drive/sample plain integers per vector:
+    i_clock, i_a, i_b, i_subtract = dut.i_clock, dut.i_a, dut.i_b, dut.i_subtract
+    o_bus, o_flag_overflow, o_flag_zero = dut.o_bus, dut.o_flag_overflow, dut.o_flag_zero
+    vectors = list(zip(a.tolist(), b.tolist(), subtract.tolist()))
+    results, overflows, zeros = [], [], []
+    i_clock <= 0
+    dut.i_send_result <= 1
+    yield from wait()
+    start = time.time()
+    for va, vb, vsubtract in vectors:
+        # Operands in on the rising edge, flags on the falling edge:
+        i_a <= va
+        i_b <= vb
+        i_subtract <= vsubtract
+        i_clock <= 1
+        yield Timer(1)
+        i_clock <= 0
+        yield Timer(1)
+        results.append(o_bus.value.integer)
+        overflows.append(o_flag_overflow.value.integer)
+        zeros.append(o_flag_zero.value.integer)
+    elapsed = time.time() - start
+    actual = np.array([results, overflows, zeros], dtype=np.uint8)
+    dut._log.info('ALU sweep: %d vectors in %.2fs, %.0f vectors/s'
+                  % (len(vectors), elapsed, len(vectors) / elapsed))
+
+    wrong = np.flatnonzero((actual != expected).any(axis=0))
+    if len(wrong):
+        n = wrong[0]
+        assertions.fail('%d of %d vectors wrong, first: %d %s %d gave (bus, overflow, zero) %s, expected %s'
+                        % (len(wrong), len(vectors), a[n], '-' if subtract[n] else '+', b[n],
+                           tuple(actual[:, n]), tuple(expected[:, n])))
+
+
+INPUTS = ('i_clock', 'i_a', 'i_b', 'i_subtract', 'i_send_result')
+OUTPUTS = ('o_bus', 'o_flag_overflow', 'o_flag_zero')
+
+
+class ALUModel(object):
+    """
+    alu.v, from its inputs: the operands are taken as i_clock rises, and
+    the flags latched as it falls while i_send_result is high
+    """
+
+    def __init__(self):
+        self.edges = Edges()
+        self.a = self.b = 0
+        # Unknown (left by an earlier test) until they are first latched:
+        self.flags = {}
+
+    def __call__(self, values):
+        edges = self.edges
+        if not edges.update(values):
+            return {}
+        if edges.rose('i_clock') and 'x' not in values['i_a'] + values['i_b']:
+            self.a, self.b = int(values['i_a'], 2), int(values['i_b'], 2)
+        result, overflow, zero = alu(self.a, self.b, values['i_subtract'] == '1')
+        if edges.fell('i_clock') and values['i_send_result'] == '1':
+            self.flags = {'o_flag_overflow': str(int(overflow)), 'o_flag_zero': str(int(zero))}
+        expected = {'o_bus': format(int(result), '08b') if values['i_send_result'] == '1'
+                    else 'zzzzzzzz'}
+        expected.update(self.flags)
+        return expected
+
+
+@cocotb.test()
+@bench.measure
+def alu_stream(dut):
+    """Random stimulus, one input at a time, with every change checked against the model"""
+    rng = random.Random(0)
+    transactions = [{'i_clock': 0, 'i_a': 0, 'i_b': 0, 'i_subtract': 0, 'i_send_result': 0}]
+    for n in range(int(os.environ.get('ALU_STREAM', 2000))):
+        name = rng.choice(INPUTS)
+        transactions.append({name: rng.randint(0, 255) if name in ('i_a', 'i_b')
+                             else rng.randint(0, 1)})
+    monitor = Monitor(dut, INPUTS + OUTPUTS)
+    checker = Checker(ALUModel())
+    monitor.subscribe(checker)
+    monitor.start()
+    driver = Driver(dut, INPUTS)
+    driver.extend(transactions)
+    driver.start()
+    yield from driver.drained()
+    monitor.stop()
+    driver.stop()
+    dut._log.info('Drove %d transactions, checked %d samples'
+                  % (driver.driven, checker.checked))
+    checker.check()
@@ -0,0 +1,75 @@
+import os
+import cocotb
+from lib import bench, model
+from lib.bench import PROGRAM, relocate
+from lib.util import assertions
+from lib.bundle import SignalBundle
+from lib.cycle import clock, wait, run_until_halt
+from lib.memory import load_ram
+
+# Clock cycles to simulate in each benchmark:
+CYCLES = int(os.environ.get('BENCH_CYCLES', 10000))
+
+# sap_memory's RAM, as built and loaded by bench/Makefile:
+ADDRESS_WIDTH = int(os.environ.get('SAP_ADDRESS_WIDTH', 4))
+DATA_WIDTH = ADDRESS_WIDTH + 4
+
+DEBUG_SIGNALS = ('i_debug_pc', 'i_debug_mar', 'i_debug_ir', 'i_debug_ram',
+                 'i_debug_bus', 'i_debug_control', 'i_debug_out',
+                 'i_debug_register_A', 'i_debug_register_B')
+PROGRAM_SIGNALS = ('i_program_mode', 'i_program_address', 'i_program_data',
+                   'i_program_write')
+
+
+def setup(dut):
+    """Reset with all debug output off, and load PROGRAM"""
+    SignalBundle(dut, DEBUG_SIGNALS).write(0)
+    SignalBundle(dut, PROGRAM_SIGNALS).write(0)
+    dut.i_clock = 0
+    dut.i_reset = 1
+    yield from wait()
+    dut.i_reset = 0
+    load_ram(dut.ram.ram, PROGRAM)
+    yield from wait()
+
+
+def assert_display(dut, cycles, image=PROGRAM, address_width=model.ADDRESS_WIDTH):
+    expected = model.run([image], max_cycles=cycles, address_width=address_width).display[0]
+    assertions.assertEqual(dut.o_display.value.integer, expected,
+                           'Display should match the model after %d cycles' % cycles)
+
+@cocotb.test()
+@bench.measure
+def sap_long_clocked(dut):
+    """Long program clocked from Python, one cycle at a time"""
+    yield from setup(dut)
+    yield from clock(dut, CYCLES)
+    assert_display(dut, CYCLES)
+
+@cocotb.test()
+@bench.measure
+def sap_long_free(dut):
+    """Long program on a free-running simulator clock"""
+    yield from setup(dut)
+    cycles = yield from run_until_halt(dut, max_cycles=CYCLES)
+    assertions.assertEqual(cycles, CYCLES, 'Program should never halt')
+    assert_display(dut, CYCLES)
+
+@cocotb.test()
+@bench.measure
+def sap_memory(dut):
+    """Long program on a sap with 2**SAP_ADDRESS_WIDTH words of RAM"""
+    image = relocate(PROGRAM, ADDRESS_WIDTH, DATA_WIDTH)
+    image = [image.get(address, 0) for address in range(1 << ADDRESS_WIDTH)]
+    SignalBundle(dut, DEBUG_SIGNALS).write(0)
+    SignalBundle(dut, PROGRAM_SIGNALS).write(0)
+    dut.i_clock = 0
+    dut.i_reset = 1
+    yield from wait()
+    dut.i_reset = 0
+    # RAM holds image from the start: bench/Makefile writes it with
+    # lib.bench.write_memory_image, and passes it as +ram_image
+    yield from wait()
+    cycles = yield from run_until_halt(dut, max_cycles=CYCLES)
+    assertions.assertEqual(cycles, CYCLES, 'Program should never halt')
+    assert_display(dut, CYCLES, image, ADDRESS_WIDTH)
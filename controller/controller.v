@@ -33,17 +33,17 @@ module controller
    );
 
    // Instruction opcodes:
-   integer     NOP = 0;
-   integer     LDA = 1;
-   integer     ADD = 2;
-   integer     SUB = 3;
-   integer     STA = 4;
-   integer     LDI = 5;
-   integer     JMP = 6;
-   integer     JC = 7;
-   integer     JZ = 8;
-   integer     OUT = 14;
-   integer     HLT = 15;
+   localparam  NOP = 4'd0;
+   localparam  LDA = 4'd1;
+   localparam  ADD = 4'd2;
+   localparam  SUB = 4'd3;
+   localparam  STA = 4'd4;
+   localparam  LDI = 4'd5;
+   localparam  JMP = 4'd6;
+   localparam  JC = 4'd7;
+   localparam  JZ = 4'd8;
+   localparam  OUT = 4'd14;
+   localparam  HLT = 4'd15;
    
    // Keep track of the current step (t-state)
    // Step 0,1 are used for Fetch Instruction
@@ -325,6 +325,11 @@ module controller
                          end
                      endcase // case (step)
                   end
+                default:
+                  begin
+                     // Undefined opcode: no case, so control_bits and
+                     // step hold, and the controller stalls here.
+                  end
               endcase // case (i_opcode)
            end // else: !if(step == 1)
       end // else: !if(i_reset)
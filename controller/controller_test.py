@@ -1,34 +1,27 @@
 import cocotb
 import numbers
+from cocotb.triggers import Timer
 from lib.util import assertions
+from lib.bundle import SignalBundle
 from lib.cycle import clock, wait, reset
+from lib import bench, isa, trace
 
 @cocotb.test()
+@bench.measure
+@trace.dump_on_failure
 def controller_test(dut):
-    
+    # The 16 control outputs, packed in the same order as control_bits:
+    outputs = SignalBundle(dut, [port for bit, name, port in isa.CONTROL_SIGNALS])
+
     def assert_control(control_bits, error_msg='wrong bits'):
-        """Check the control bits output"""
-        # Reverse the order of the bits, so they have the same index as in verilog:
-        control_bits = control_bits[::-1]
-        # Remove blanks used for debug delimiter:
-        control_bits = control_bits.replace('_','')
-        # Check it:
-        assertions.assertEqual(dut.o_halt.value.binstr, control_bits[15], 'incorrect halt value')
-        assertions.assertEqual(dut.o_memory_address_in.value.binstr, control_bits[14], 'incorrect MAR In')
-        assertions.assertEqual(dut.o_ram_in.value.binstr, control_bits[13], 'incorrect RAM In')
-        assertions.assertEqual(dut.o_ram_out.value.binstr, control_bits[12], 'incorrect RAM Out')
-        assertions.assertEqual(dut.o_instruction_in.value.binstr, control_bits[11], 'incorrect Instruction In')
-        assertions.assertEqual(dut.o_instruction_out.value.binstr, control_bits[10], 'incorrect Instruction Out')
-        assertions.assertEqual(dut.o_register_a_in.value.binstr, control_bits[9], 'incorrect Register A In')
-        assertions.assertEqual(dut.o_register_a_out.value.binstr, control_bits[8], 'incorrect Register A Out')
-        assertions.assertEqual(dut.o_alu_out.value.binstr, control_bits[7], 'incorrect ALU Out')
-        assertions.assertEqual(dut.o_alu_subtract.value.binstr, control_bits[6], 'incorrect ALU Subtract')
-        assertions.assertEqual(dut.o_register_b_in.value.binstr, control_bits[5], 'incorrect Register B In')
-        assertions.assertEqual(dut.o_register_output_in.value.binstr, control_bits[4], 'incorrect Register Out In')
-        assertions.assertEqual(dut.o_program_counter_increment.value.binstr, control_bits[3], 'incorrect PC Increment')
-        assertions.assertEqual(dut.o_program_counter_out.value.binstr, control_bits[2], 'incorrect PC Out')
-        assertions.assertEqual(dut.o_program_counter_jump.value.binstr, control_bits[1], 'incorrect PC Jump')
-        assertions.assertEqual(dut.o_register_flags_in.value.binstr, control_bits[0], 'incorrect Register Flags In')
+        """Check the control outputs"""
+        # Remove blanks used for debug delimiter, and compare as one integer:
+        expected = int(control_bits.replace('_',''), 2)
+        undefined = outputs.undefined()
+        assertions.assertFalse(undefined, '%s: %s undefined' % (error_msg, ', '.join(undefined)))
+        actual = outputs.read()
+        assertions.assertEqual(actual, expected, '%s: got %s, expected %s' % (
+            error_msg, isa.control_names(actual), isa.control_names(expected)))
 
     def assert_step(value, error_msg='wrong assumed step count'):
         if isinstance(value, numbers.Number):
@@ -37,7 +30,7 @@ def controller_test(dut):
         
     def reset():
         dut.i_opcode = 0b0000
-        dut.i_flag_carry = 0
+        dut.i_flag_overflow = 0
         dut.i_flag_zero = 0
         dut.i_reset = 1
         yield from wait()
@@ -108,13 +101,13 @@ def controller_test(dut):
 
     ### Test JC without carry
     dut.i_opcode = 0b0111
-    dut.i_flag_carry = 0
+    dut.i_flag_overflow = 0
     yield from assert_fetch_cycle()
     assert_control('0000_0000_0000_0000', 'JC cycle 1 (without carry): NOP')
 
     ### Test JC with carry
     dut.i_opcode = 0b0111
-    dut.i_flag_carry = 1
+    dut.i_flag_overflow = 1
     yield from assert_fetch_cycle()
     assert_control('0000_1000_0000_0010', 'JC cycle 1 (with carry): IO | J')
 
@@ -140,4 +133,57 @@ def controller_test(dut):
     yield from assert_fetch_cycle()
     assert_control('1000_0000_0000_0000','HLT cycle 1 - HLT')
 
-    
+@cocotb.test()
+@bench.measure
+@trace.dump_on_failure
+def controller_sweep(dut):
+    """Check every opcode x step x carry x zero against the microcode table"""
+    # A control word the controller never outputs, to tell when it stalls:
+    previous = isa.FI
+    i_opcode, i_flag_overflow, i_flag_zero = dut.i_opcode, dut.i_flag_overflow, dut.i_flag_zero
+    step, control_bits, o_step = dut.step, dut.control_bits, dut.o_step
+    # The 16 control outputs, packed in the same order as control_bits:
+    outputs = SignalBundle(dut, [port for bit, name, port in isa.CONTROL_SIGNALS])
+    dut.i_debug = 0
+    dut.i_reset = 0
+    dut.i_clock = 0
+    yield from wait()
+
+    checked_ports = set()
+    wrong = []
+    combinations = 0
+    for opcode in range(16):
+        for s in range(isa.STEPS):
+            for carry in (0, 1):
+                for zero in (0, 1):
+                    # Put the controller straight into step s:
+                    step <= s
+                    control_bits <= previous
+                    i_opcode <= opcode
+                    i_flag_overflow <= carry
+                    i_flag_zero <= zero
+                    yield Timer(1)
+                    yield from clock(dut)
+                    combinations += 1
+
+                    expected = isa.MICROCODE[isa.microcode_index(opcode, s, carry, zero)]
+                    if expected is None:
+                        # No case in controller.v: everything holds
+                        expected = (previous, s)
+                    actual = (control_bits.value.integer, o_step.value.integer)
+                    if actual != expected:
+                        wrong.append((opcode, s, carry, zero, actual, expected))
+                    elif actual[0] not in checked_ports:
+                        # Each distinct word once: the outputs match control_bits
+                        checked_ports.add(actual[0])
+                        assertions.assertEqual(isa.control_names(outputs.read()),
+                                               isa.control_names(actual[0]),
+                                               'control outputs should match control_bits')
+
+    if wrong:
+        opcode, s, carry, zero, actual, expected = wrong[0]
+        assertions.fail('%d of %d combinations wrong, first: opcode %s step %d carry %d zero %d '
+                        'gave %s -> step %d, expected %s -> step %d' % (
+                            len(wrong), combinations, isa.MNEMONICS.get(opcode, format(opcode, '04b')),
+                            s, carry, zero, isa.control_names(actual[0]), actual[1],
+                            isa.control_names(expected[0]), expected[1]))
@@ -0,0 +1,216 @@
+"""
+Assembler and disassembler for the SAP-1 instruction set (lib.isa).
+
+A source line is an optional label, then an instruction or a directive,
+then an optional comment:
+
+    start:  LDA x       ; A = RAM[x]
+            ADD 0xE
+            JC  start
+            OUT
+            HLT
+    x:      .byte 16
+            .org 0xE
+            .byte 127, 0b1
+
+Operands are numbers (decimal, 0x hex or 0b binary) or labels, and are
+optional, 0 by default, for every instruction. Directives:
+  .org ADDRESS       continue assembling at ADDRESS
+  .byte VALUE, ...   data bytes (also: db)
+Bytes not written are 0.
+
+disassemble() turns an image back into source that assembles to the
+same bytes: code reachable from address 0 as instructions, with labels
+for jump targets and data addresses, and everything else as .byte.
+
+Images are for a sap of lib.model's ADDRESS_WIDTH and DATA_WIDTH by
+default, or of the widths given: each word a 4 bit opcode over a
+(DATA_WIDTH - 4) bit operand.
+
+Usage: python -m lib.assembler [--address-width N] [--data-width N] SOURCE [-o IMAGE]
+       python -m lib.assembler [--data-width N] --disassemble IMAGE
+"""
+import argparse
+import re
+import sys
+
+from lib import isa
+from lib.memory import read_image, write_memh
+from lib.model import ADDRESS_WIDTH, DATA_WIDTH, RAM_SIZE, as_images, data_width_of
+
+_LINE = re.compile(r'^\s*(?:([A-Za-z_]\w*)\s*:)?\s*(?:([.\w]+)(?:\s+(.*?))?)?\s*$')
+
+# Instructions whose operand is a RAM address, or a jump target:
+DATA_OPERANDS = (isa.LDA, isa.ADD, isa.SUB, isa.STA)
+JUMPS = (isa.JMP, isa.JC, isa.JZ)
+
+
+def _number(text):
+    try:
+        return int(text, 0)
+    except ValueError:
+        return None
+
+
+def assemble(source, name='<source>', size=RAM_SIZE, data_width=DATA_WIDTH):
+    """
+    Assemble source text into a list of size words, each data_width bits:
+    a 4 bit opcode over a (data_width - 4) bit operand, or a .byte value
+    """
+    # First pass: addresses of labels, and what goes where:
+    labels = {}
+    items = [] # (line number, address, mnemonic or '.byte', operand texts)
+    address = 0
+    for number, line in enumerate(source.splitlines(), 1):
+        match = _LINE.match(line.split(';')[0])
+        if not match:
+            raise ValueError('%s:%d: cannot parse: %s' % (name, number, line.strip()))
+        label, word, operands = match.groups()
+        if label:
+            if label in labels:
+                raise ValueError('%s:%d: label %s defined twice' % (name, number, label))
+            labels[label] = address
+        if not word:
+            continue
+        word = word.lower()
+        operands = [o.strip() for o in operands.split(',')] if operands else []
+        if word == '.org':
+            if len(operands) != 1 or _number(operands[0]) is None:
+                raise ValueError('%s:%d: .org takes one number' % (name, number))
+            address = _number(operands[0])
+        elif word in ('.byte', 'db'):
+            if not operands:
+                raise ValueError('%s:%d: %s needs a value' % (name, number, word))
+            items.append((number, address, '.byte', operands))
+            address += len(operands)
+        elif word.upper() in isa.OPCODES:
+            if len(operands) > 1:
+                raise ValueError('%s:%d: %s takes one operand' % (name, number, word.upper()))
+            items.append((number, address, word.upper(), operands))
+            address += 1
+        else:
+            raise ValueError('%s:%d: unknown instruction %s' % (name, number, word))
+
+    # Second pass: resolve operands and encode:
+    def value(number, text, bits):
+        result = _number(text)
+        if result is None:
+            if text not in labels:
+                raise ValueError('%s:%d: undefined label %s' % (name, number, text))
+            result = labels[text]
+        if not 0 <= result < 1 << bits:
+            raise ValueError('%s:%d: %s does not fit in %d bits' % (name, number, text, bits))
+        return result
+
+    image = [0] * size
+    written = set()
+    for number, address, word, operands in items:
+        if word == '.byte':
+            data = [value(number, text, data_width) for text in operands]
+        else:
+            operand = value(number, operands[0], data_width - 4) if operands else 0
+            data = [isa.OPCODES[word] << (data_width - 4) | operand]
+        for offset, byte in enumerate(data):
+            if not 0 <= address + offset < size:
+                raise ValueError('%s:%d: address %d is outside the %d byte RAM'
+                                 % (name, number, address + offset, size))
+            if address + offset in written:
+                raise ValueError('%s:%d: address %x written twice' % (name, number, address + offset))
+            written.add(address + offset)
+            image[address + offset] = byte
+    return image
+
+
+def _split(word, data_width):
+    """(opcode, operand) of an instruction word"""
+    return word >> (data_width - 4), word & ((1 << (data_width - 4)) - 1)
+
+
+def _code(image, data_width=DATA_WIDTH):
+    """Addresses of the instructions reachable from address 0"""
+    code = set()
+    pending = [0]
+    while pending:
+        address = pending.pop()
+        while address < len(image) and address not in code:
+            opcode, operand = _split(image[address], data_width)
+            if opcode not in isa.MNEMONICS:
+                break # Stalls the controller
+            code.add(address)
+            if opcode == isa.HLT:
+                break
+            if opcode in JUMPS:
+                pending.append(operand)
+                if opcode == isa.JMP:
+                    break
+            address += 1
+    return code
+
+
+def disassemble(source, data_width=DATA_WIDTH):
+    """
+    Disassemble a RAM image of data_width bit words (see
+    lib.memory.read_image) into assembler source
+    """
+    image = read_image(source, data_width)
+    code = _code(image, data_width)
+    labels = {}
+    for address in sorted(code):
+        opcode, operand = _split(image[address], data_width)
+        if opcode in JUMPS:
+            labels.setdefault(operand, 'L%X' % operand)
+        elif opcode in DATA_OPERANDS:
+            labels.setdefault(operand, 'D%X' % operand)
+    lines = []
+    for address, byte in enumerate(image):
+        label = labels.get(address, '')
+        label = label + ':' if label else ''
+        if address in code:
+            opcode, operand = _split(byte, data_width)
+            text = isa.MNEMONICS[opcode]
+            if opcode in JUMPS or opcode in DATA_OPERANDS:
+                text = '%-4s%s' % (text, labels[operand])
+            elif operand or opcode == isa.LDI:
+                text = '%-4s%d' % (text, operand)
+        else:
+            text = '.byte %d' % byte
+        lines.append('%-8s%-16s; %x: %s' % (label, text, address, format(byte, '0%db' % data_width)))
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help='assembler source, or an image to disassemble')
+    parser.add_argument('-o', '--output', default=None,
+                        help='image to write: raw binary, or $readmemh for .mem/.memh '
+                        '(default: SOURCE with .bin)')
+    parser.add_argument('-d', '--disassemble', action='store_true',
+                        help='disassemble an image (binary, Intel HEX or $readmemh)')
+    parser.add_argument('--address-width', type=int, default=ADDRESS_WIDTH,
+                        help='of the sap: 2**N words of RAM (default: %(default)s)')
+    parser.add_argument('--data-width', type=int, default=None,
+                        help='bits per word (default: address width + 4)')
+    args = parser.parse_args(argv)
+    data_width = data_width_of(args.address_width, args.data_width)
+
+    if args.disassemble:
+        sys.stdout.write(disassemble(args.source, data_width))
+        return 0
+    with open(args.source) as source:
+        try:
+            image = assemble(source.read(), args.source, 1 << args.address_width, data_width)
+        except ValueError as error:
+            sys.stderr.write('%s\n' % error)
+            return 1
+    output = args.output or re.sub(r'\.\w+$', '', args.source) + '.bin'
+    if output.endswith(('.mem', '.memh')):
+        write_memh(image, output, data_width)
+    else:
+        with open(output, 'wb') as binary:
+            binary.write(as_images(image, args.address_width, data_width).tobytes())
+    print('%s: %d words' % (output, len(image)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
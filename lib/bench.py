@@ -0,0 +1,401 @@
+"""
+Simulation throughput benchmarks.
+
+Each scenario is an existing testbench (or one in bench/) run with an
+isolated, uncached build. For every scenario this records the compile
+time, the simulation wall time split into simulator and Python time,
+simulated clock cycles per second and the simulator's peak RSS. Results
+are written as JSON and compared against bench/baseline.json; scenarios
+it has no entry for are reported as unchecked, and only fail the run
+with --require-baseline.
+
+Python time is every reaction of the cocotb scheduler to a trigger: the
+test, every coroutine it forked (clocks, monitors, scoreboards and
+profilers too) and the scheduler itself. The rest of the wall time is
+spent in the simulator.
+
+Testbenches report their side of the numbers through the @bench.measure
+decorator, when SAP_BENCH_RESULT names a file to write them to.
+
+Scenarios run on Icarus, unless other simulator backends are given with
+--backends: then each runs on every backend, with their cycles per
+second compared side by side. Results from backends other than Icarus
+are named SCENARIO@BACKEND.
+
+Usage: python -m lib.bench [--threshold PERCENT] [--update-baseline]
+                           [--require-baseline] [--backends BACKEND ...]
+                           [SCENARIO ...]
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from lib import isa
+from lib.memory import write_memh
+
+SAP_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(SAP_HOME, 'bench')
+BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS = os.path.join(BENCH_DIR, 'results.json')
+BUILD_ROOT = os.path.join(BENCH_DIR, 'build')
+DEFAULT_THRESHOLD = 20 # percent
+BACKENDS = ('icarus', 'verilator') # as lib/UnitMakefile's SIM
+DEFAULT_BACKEND = 'icarus'
+
+# name -> (testbench directory, extra environment)
+SCENARIOS = OrderedDict((
+    ('sap', ('.', {})),
+    ('alu', ('alu', {'TESTCASE': 'alu_test'})),
+    ('alu_sweep', ('alu', {'TESTCASE': 'alu_sweep', 'ALU_SWEEP': '1'})),
+    ('alu_stream', ('alu', {'TESTCASE': 'alu_stream', 'ALU_STREAM': '20000'})),
+    ('controller', ('controller', {})),
+    ('ram_16x8', ('ram_16x8', {})),
+    ('sap_long_clocked', ('bench', {'TESTCASE': 'sap_long_clocked', 'BENCH_CYCLES': '20000'})),
+    ('sap_long_free', ('bench', {'TESTCASE': 'sap_long_free', 'BENCH_CYCLES': '200000'})),
+    ('sap_memory_16', ('bench', {'TESTCASE': 'sap_memory', 'BENCH_CYCLES': '100000',
+                                 'SAP_ADDRESS_WIDTH': '4'})),
+    ('sap_memory_256', ('bench', {'TESTCASE': 'sap_memory', 'BENCH_CYCLES': '100000',
+                                  'SAP_ADDRESS_WIDTH': '8'})),
+    ('sap_memory_64k', ('bench', {'TESTCASE': 'sap_memory', 'BENCH_CYCLES': '100000',
+                                  'SAP_ADDRESS_WIDTH': '16'})),
+))
+
+# Metrics compared against the baseline, and whether bigger is better:
+COMPARED = (
+    ('cycles_per_second', True),
+    ('compile_seconds', False),
+    ('simulation_seconds', False),
+    ('python_seconds', False),
+    ('peak_rss_kb', False),
+)
+
+# The program bench/ runs: it has no HLT, so it runs forever. The PC
+# rolls over at the end of RAM, and the data bytes (all < 16) execute
+# as NOPs.
+PROGRAM = [
+    0b00011111, # LDA F
+    0b00101110, # ADD E
+    0b11100000, # OUT
+    0b00111101, # SUB D
+    0b11100000, # OUT
+    0b00101110, # ADD E
+    0b00101110, # ADD E
+    0b11100000, # OUT
+    0b00111101, # SUB D
+    0b11100000, # OUT
+    0b00101110, # ADD E
+    0b11100000, # OUT
+    0b00000000, # NOP
+    0b00000001, # D = 1
+    0b00000011, # E = 3
+    0b00000101, # F = 5
+]
+
+
+def relocate(program, address_width, data_width):
+    """
+    PROGRAM for a wider sap: its data moved to the top of RAM, and its
+    instructions encoded with a (data_width - 4) bit operand. Returns
+    {address: word}, RAM between the code and data left cleared.
+    """
+    top = 1 << address_width
+    moved = {address: top - 16 + address for address in range(13, 16)}
+    image = {}
+    for address, byte in enumerate(program[:13]):
+        opcode, operand = byte >> 4, byte & 0x0f
+        if opcode in (isa.LDA, isa.ADD, isa.SUB):
+            operand = moved[operand]
+        image[address] = opcode << (data_width - 4) | operand
+    for address in moved:
+        image[moved[address]] = program[address]
+    return image
+
+
+def write_memory_image(path, address_width):
+    """
+    Write PROGRAM, relocated for 2**address_width words of RAM, as the
+    +ram_image of the sap_memory scenarios (see bench/Makefile)
+    """
+    image = relocate(PROGRAM, address_width, address_width + 4)
+    write_memh([image.get(address, 0) for address in range(1 << address_width)],
+               path, address_width + 4)
+
+
+class ReactionTimer(object):
+    """
+    Times the cocotb scheduler's reactions to triggers, once installed.
+    Every coroutine runs inside one, so this is all of the Python that
+    runs between the simulator's callbacks.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.react = scheduler._react
+        self.seconds = 0.0
+
+    def __call__(self, trigger):
+        if self.scheduler._is_reacting:
+            # Queued for the reaction already running, and timed with it:
+            return self.react(trigger)
+        start = time.perf_counter()
+        try:
+            return self.react(trigger)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def install(self):
+        # Triggers prime with the scheduler's _react as their callback:
+        self.scheduler._react = self
+
+    def remove(self):
+        if self.scheduler.__dict__.get('_react') is self:
+            del self.scheduler._react
+
+
+def measure(test):
+    """
+    Decorate a cocotb test to time the Python it and every coroutine it
+    forks run (see ReactionTimer), as opposed to time spent in the
+    simulator.
+    """
+    @functools.wraps(test)
+    def wrapper(dut, *args, **kwargs):
+        # Imported here, so the runner does not need cocotb:
+        import cocotb
+        from cocotb.utils import get_sim_time
+        from lib import trace
+        inner = test(dut, *args, **kwargs)
+        timer = ReactionTimer(cocotb.scheduler)
+        setup = 0.0
+        start = time.perf_counter()
+        timer.install()
+        try:
+            # The test's first step runs in the reaction that started it,
+            # before the timer was installed, so it is timed on its own:
+            try:
+                trigger = inner.send(None)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                setup = time.perf_counter() - start
+            while True:
+                try:
+                    send, error = (yield trigger), None
+                except Exception as e:
+                    send, error = None, e
+                try:
+                    trigger = inner.throw(error) if error is not None else inner.send(send)
+                except StopIteration as stop:
+                    return stop.value
+        finally:
+            timer.remove()
+            write_result({
+                'test': test.__name__,
+                'wall_seconds': time.perf_counter() - start,
+                'python_seconds': setup + timer.seconds,
+                'cycles': trace.recorder(dut).count,
+                'sim_time': get_sim_time(),
+                'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            })
+    return wrapper
+
+
+def write_result(result, path=None):
+    """Append one test's measurements to $SAP_BENCH_RESULT, if set"""
+    path = path or os.environ.get('SAP_BENCH_RESULT')
+    if path:
+        with open(path, 'a') as out:
+            out.write(json.dumps(result) + '\n')
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+def timed_make(directory, targets, env):
+    start = time.perf_counter()
+    with open(os.path.join(env['SAP_BENCH_DIR'], 'make.log'), 'a') as log:
+        returncode = subprocess.call(['make'] + targets, cwd=directory, env=env,
+                                     stdout=log, stderr=subprocess.STDOUT)
+    return returncode, time.perf_counter() - start
+
+
+def result_name(name, backend):
+    return name if backend == DEFAULT_BACKEND else '%s@%s' % (name, backend)
+
+
+def run_scenario(name, build_root, backend=DEFAULT_BACKEND):
+    """Compile and run one scenario on a simulator backend, returning its metrics"""
+    subdirectory, extra_env = SCENARIOS[name]
+    directory = os.path.normpath(os.path.join(SAP_HOME, subdirectory))
+    scenario_dir = os.path.join(build_root, result_name(name, backend))
+    os.makedirs(scenario_dir)
+    sim_build = os.path.join(scenario_dir, 'sim_build')
+    result_file = os.path.join(scenario_dir, 'result.jsonl')
+    env = dict(os.environ, PWD=directory, SIM_CACHE='', SAP_BENCH_DIR=scenario_dir,
+               SAP_BENCH_RESULT=result_file, SIM=backend, **extra_env)
+    make_args = ['SIM_BUILD=%s' % sim_build, 'SIM_CACHE=', 'SIM=%s' % backend]
+
+    status, compile_seconds = timed_make(directory, ['compile'] + make_args, env)
+    if status == 0:
+        status, run_seconds = timed_make(directory, ['sim'] + make_args, env)
+    else:
+        run_seconds = 0.0
+    tests = read_results(result_file)
+    metrics = OrderedDict([('ok', status == 0 and bool(tests)),
+                           ('compile_seconds', compile_seconds),
+                           ('run_seconds', run_seconds)])
+    if tests:
+        wall = sum(t['wall_seconds'] for t in tests)
+        python = sum(t['python_seconds'] for t in tests)
+        cycles = sum(t['cycles'] for t in tests)
+        metrics['cycles'] = cycles
+        metrics['simulation_seconds'] = wall - python
+        metrics['python_seconds'] = python
+        metrics['startup_seconds'] = max(0.0, run_seconds - wall)
+        metrics['cycles_per_second'] = cycles / wall if cycles and wall else None
+        metrics['sim_time_per_second'] = sum(t['sim_time'] for t in tests) / wall if wall else None
+        metrics['peak_rss_kb'] = max(t['peak_rss_kb'] for t in tests)
+    else:
+        metrics['log'] = os.path.join(scenario_dir, 'make.log')
+    return metrics
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Return a list of regressions beyond threshold percent, as strings.
+    Scenarios missing from the baseline are not compared: see unchecked().
+    """
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if before.get('ok') and not metrics.get('ok'):
+            regressions.append('%s: no longer runs' % name)
+            continue
+        for metric, bigger_is_better in COMPARED:
+            old, new = before.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = 100.0 * (new - old) / old
+            worse = -change if bigger_is_better else change
+            if worse > threshold:
+                regressions.append('%s: %s %.4g -> %.4g (%+.1f%%)' % (name, metric, old, new, change))
+    return regressions
+
+
+def unchecked(results, baseline):
+    """Names of the results with no baseline to compare against"""
+    return [name for name in results if name not in baseline]
+
+
+def print_table(results, out=sys.stdout):
+    columns = (('compile s', 'compile_seconds'), ('sim s', 'simulation_seconds'),
+               ('python s', 'python_seconds'), ('cycles', 'cycles'),
+               ('cycles/s', 'cycles_per_second'), ('rss kB', 'peak_rss_kb'))
+    width = max(len(name) for name in list(results) + ['scenario'])
+    out.write('%-*s' % (width, 'scenario'))
+    out.write(''.join(' %10s' % title for title, column in columns) + '\n')
+    for name, metrics in results.items():
+        if not metrics.get('ok'):
+            out.write('%-*s FAILED, see %s\n' % (width, name, metrics.get('log')))
+            continue
+        out.write('%-*s' % (width, name))
+        for title, column in columns:
+            value = metrics.get(column)
+            out.write(' %10s' % ('-' if value is None else '%.4g' % value))
+        out.write('\n')
+
+
+def print_backends(results, names, backends, out=sys.stdout):
+    """Cycles per second of each scenario on each backend, side by side"""
+    width = max(len(name) for name in list(names) + ['scenario'])
+    out.write('%-*s' % (width, 'scenario'))
+    out.write(''.join(' %12s' % backend for backend in backends))
+    out.write(' %8s\n' % ('speedup' if len(backends) == 2 else ''))
+    for name in names:
+        rates = []
+        for backend in backends:
+            metrics = results[result_name(name, backend)]
+            rates.append(metrics.get('cycles_per_second') if metrics.get('ok') else None)
+        out.write('%-*s' % (width, name))
+        out.write(''.join(' %12s' % ('-' if rate is None else '%.4g' % rate)
+                          for rate in rates))
+        if len(rates) == 2 and None not in rates:
+            out.write(' %7.1fx' % (rates[1] / rates[0]))
+        out.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', help='only run these (default: all)')
+    parser.add_argument('--output', default=RESULTS, help='results file (default: %(default)s)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='percent change counted as a regression (default: %(default)s)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='write these results as the new baseline')
+    parser.add_argument('--require-baseline', action='store_true',
+                        help='fail scenarios the baseline has no entry for')
+    parser.add_argument('--backends', nargs='+', default=[DEFAULT_BACKEND], choices=BACKENDS,
+                        help='simulators to run every scenario on (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error('no such scenario: %s' % ', '.join(unknown))
+
+    # Kept until the next run, for the logs of failed scenarios:
+    shutil.rmtree(BUILD_ROOT, ignore_errors=True)
+    results = OrderedDict((result_name(name, backend), run_scenario(name, BUILD_ROOT, backend))
+                          for name in names for backend in args.backends)
+
+    document = {
+        'host': {'node': platform.node(), 'machine': platform.machine(),
+                 'python': platform.python_version()},
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenarios': results,
+    }
+    with open(args.output, 'w') as out:
+        json.dump(document, out, indent=2)
+    print_table(results)
+    if len(args.backends) > 1:
+        print('\nCycles per second:')
+        print_backends(results, names, args.backends)
+
+    if args.update_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print('Baseline updated: %s' % args.baseline)
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file).get('scenarios', {})
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print('REGRESSION: %s' % regression)
+    missing = unchecked(results, baseline)
+    for name in missing:
+        print('%s: %s is not in the baseline, record it with --update-baseline'
+              % ('MISSING' if args.require_baseline else 'UNCHECKED', name))
+    failed = [name for name, metrics in results.items() if not metrics.get('ok')]
+    if args.require_baseline and missing:
+        return 1
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
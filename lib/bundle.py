@@ -0,0 +1,67 @@
+"""
+Named groups of DUT signals, looked up once and then read or driven
+together as one packed integer.
+
+Signals are packed like a Verilog concatenation: the first signal in the
+group takes the most significant bits.
+"""
+import numpy as np
+
+from lib.util import handle
+
+
+class SignalBundle(object):
+    """A group of signals, eg. SignalBundle(dut, ('i_a', 'i_b', 'i_subtract'))"""
+
+    def __init__(self, dut, signals):
+        self.names = tuple(signals)
+        self.handles = tuple(handle(dut, name) for name in self.names)
+        self.widths = tuple(len(h) for h in self.handles)
+        # Bit position of each signal within the packed integer:
+        shifts, shift = [], 0
+        for width in reversed(self.widths):
+            shifts.insert(0, shift)
+            shift += width
+        self.shifts = tuple(shifts)
+        self.width = shift
+        self.fields = tuple(zip(self.handles, self.shifts, self.widths))
+
+    def __len__(self):
+        return self.width
+
+    def read(self):
+        """Read the whole group as one integer; x/z signals read as 0"""
+        packed = 0
+        for signal, shift, width in self.fields:
+            value = signal.value
+            if value.is_resolvable:
+                packed |= value.integer << shift
+        return packed
+
+    def undefined(self):
+        """Names of the signals in the group currently holding x or z bits"""
+        return [name for name, signal in zip(self.names, self.handles)
+                if not signal.value.is_resolvable]
+
+    def read_row(self, out=None):
+        """Read each signal into a NumPy row (or into out), x/z as 0"""
+        if out is None:
+            out = np.zeros(len(self.handles), dtype=np.uint64)
+        for index, signal in enumerate(self.handles):
+            value = signal.value
+            out[index] = value.integer if value.is_resolvable else 0
+        return out
+
+    def unpack(self, packed):
+        """Split a packed integer into {name: value}"""
+        return {name: (packed >> shift) & ((1 << width) - 1)
+                for name, (signal, shift, width) in zip(self.names, self.fields)}
+
+    def write(self, packed):
+        """Drive every signal in the group from one packed integer"""
+        for signal, shift, width in self.fields:
+            signal <= (packed >> shift) & ((1 << width) - 1)
+
+    def write_all(self, value):
+        """Drive every signal in the group to 0, or to all ones if value is true"""
+        self.write((1 << self.width) - 1 if value else 0)
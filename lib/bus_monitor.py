@@ -0,0 +1,216 @@
+"""
+Bus contention and x/z monitor of the sap computer.
+
+Once a clock cycle, after the falling edge, a BusMonitor reads the
+controller's control word, the bus and i_program_write, and packs them
+into a 16 bit record: which units drive the bus, which load from it, and
+whether it holds x or z bits. The control word maps to its driver and
+load bits, and to whether it enables more than one driver, through one
+table lookup; only records with a contention or x/z flag set are looked
+at any further. That keeps it cheap enough to leave on for long runs.
+
+It fails on:
+  contention - more than one unit driving the bus, or i_program_write
+               while the controller reads or writes RAM
+  undefined  - a unit loading x or z bits of the bus (only the address
+               bits, for the MAR), or the control word or i_program_write
+               holding x or z bits
+
+Records are kept a chunk at a time, and written to a file if given one
+(a 16 byte header, then the records), for read() to map back in.
+"""
+import os
+import struct
+
+import numpy as np
+
+from lib import isa
+from lib.util import handle
+
+# Record bits:
+DRIVERS = (('CO', isa.CO), ('RO', isa.RO), ('IO', isa.IO), ('AO', isa.AO), ('EO', isa.EO))
+LOADS = (('MI', isa.MI), ('RI', isa.RI), ('II', isa.II), ('AI', isa.AI), ('BI', isa.BI),
+         ('OI', isa.OI))
+BITS = {}
+for _bit, (_name, _control) in enumerate(DRIVERS + (('PW', None),) + LOADS):
+    BITS[_name] = 1 << _bit
+BUS_X = 1 << 12       # bus holds x bits
+BUS_Z = 1 << 13       # bus holds z bits
+CONTENTION = 1 << 14  # more than one driver, or PW with RO or RI
+UNDEFINED = 1 << 15   # control word or program write signal is x/z
+
+DRIVER_MASK = sum(BITS[name] for name, control in DRIVERS)
+LOAD_MASK = sum(BITS[name] for name, control in LOADS)
+ADDRESS_BITS = 4 # bus bits the MAR loads
+
+RECORD = np.dtype('<u2')
+MAGIC = b'SAPBUSMN'
+VERSION = 1
+_HEADER = struct.Struct('<8sII')
+
+DEFAULT_CHUNK = 1 << 16 # records per write
+
+
+def _table():
+    """Record bits for every control word"""
+    control = np.arange(1 << 16)
+    table = np.zeros(1 << 16, dtype=np.uint16)
+    drivers = np.zeros(1 << 16, dtype=np.uint8)
+    for name, bits in DRIVERS + LOADS:
+        on = (control & bits) != 0
+        table[on] |= BITS[name]
+        if (name, bits) in DRIVERS:
+            drivers += on
+    table[drivers > 1] |= CONTENTION
+    return table
+
+TABLE = _table()
+
+
+def names(record):
+    """The drivers and loads of a record, eg. ['RO', 'II']"""
+    return [name for name, bit in sorted(BITS.items(), key=lambda item: item[1])
+            if record & bit]
+
+
+def describe(record):
+    """A record as text, eg. 'RO II bus x'"""
+    flags = names(record)
+    if record & BUS_X:
+        flags.append('bus x')
+    if record & BUS_Z:
+        flags.append('bus z')
+    if record & UNDEFINED:
+        flags.append('control x')
+    return ' '.join(flags) or 'idle'
+
+
+class BusMonitor(object):
+    """
+    Packs one record per clock cycle of a sap DUT, and fails on bus
+    contention, undefined loads or an undefined control word. With strict=False, errors are only
+    counted and kept (up to max_errors) for check().
+    """
+
+    def __init__(self, dut, path=None, strict=True, chunk=DEFAULT_CHUNK, max_errors=100):
+        self.dut = dut
+        self.control = handle(dut, 'control.control_bits')
+        self.bus = dut.bus
+        self.program_write = dut.i_program_write
+        self.step = handle(dut, 'control.step')
+        self.strict = strict
+        self.max_errors = max_errors
+        self.records = np.zeros(chunk, dtype=RECORD)
+        self.used = 0
+        self.cycle = 0
+        self.errors = []
+        self.error_count = 0
+        self.running = False
+        self.file = None
+        if path is not None:
+            self.file = open(path, 'wb')
+            self.file.write(_HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+
+    def sample(self):
+        """Record the cycle that just ran; returns an error message, or None"""
+        self.cycle += 1
+        control = self.control.value
+        if control.is_resolvable:
+            record = int(TABLE[control.integer])
+        else:
+            record = UNDEFINED
+        program_write = self.program_write.value
+        if not program_write.is_resolvable:
+            record |= UNDEFINED
+        elif program_write.integer:
+            record |= BITS['PW']
+            if record & (BITS['RO'] | BITS['RI']):
+                record |= CONTENTION
+        bus = self.bus.value
+        if not bus.is_resolvable:
+            bits = bus.binstr.lower()
+            if 'x' in bits:
+                record |= BUS_X
+            if 'z' in bits:
+                record |= BUS_Z
+        self.records[self.used] = record
+        self.used += 1
+        if self.used == len(self.records):
+            self.flush()
+        if record & (CONTENTION | BUS_X | BUS_Z | UNDEFINED):
+            return self.check_record(record, bus)
+        return None
+
+    def check_record(self, record, bus):
+        """Look into a record flagged for contention or x/z bits"""
+        error = None
+        if record & UNDEFINED:
+            error = 'Undefined control word or i_program_write: %s, %s' % (
+                self.control.value.binstr, self.program_write.value.binstr)
+        elif record & CONTENTION:
+            error = 'Bus contention: %s' % ' and '.join(
+                name for name in names(record) if BITS[name] & (DRIVER_MASK | BITS['PW']))
+        elif record & LOAD_MASK:
+            bits = bus.binstr.lower()
+            loading = [name for name in names(record) if BITS[name] & LOAD_MASK and
+                       not (name == 'MI' and bits[-ADDRESS_BITS:].isdigit())]
+            if loading:
+                error = '%s loading undefined bus bits' % ' and '.join(loading)
+        if error is None:
+            return None
+        step = self.step.value
+        error = '%s at cycle %d (step %s, control %s): bus %s' % (
+            error, self.cycle, step.integer if step.is_resolvable else step.binstr,
+            describe(record), bus.binstr)
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(error)
+        return error
+
+    def flush(self):
+        if self.file is not None:
+            self.file.write(self.records[:self.used].tobytes())
+            self.file.flush()
+        self.used = 0
+
+    def close(self):
+        self.running = False
+        if self.file is not None and not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def monitor(self):
+        # Imported here, so record files can be read without cocotb:
+        from cocotb.triggers import FallingEdge, ReadOnly
+        clock = self.dut.i_clock
+        while self.running:
+            yield FallingEdge(clock)
+            yield ReadOnly()
+            if self.running:
+                error = self.sample()
+                if error is not None and self.strict:
+                    raise AssertionError(error)
+
+    def start(self):
+        """Fork the monitor, sampling until close()"""
+        import cocotb
+        self.running = True
+        return cocotb.fork(cocotb.coroutine(self.monitor)())
+
+    def check(self):
+        """Fail with the first error seen, if there was one"""
+        if self.errors:
+            raise AssertionError('%s\n(%d bus errors in %d cycles)'
+                                 % (self.errors[0], self.error_count, self.cycle))
+
+
+def read(path):
+    """Memory-map a record file as an array of records"""
+    with open(path, 'rb') as header:
+        magic, version, size = _HEADER.unpack(header.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION or size != RECORD.itemsize:
+        raise ValueError('%s is not a version %d bus monitor file' % (path, VERSION))
+    count = (os.path.getsize(path) - _HEADER.size) // RECORD.itemsize
+    if not count:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=_HEADER.size, shape=(count,))
@@ -0,0 +1,156 @@
+"""
+Compact binary capture of the sap bus and control signals.
+
+A capture samples the bus, the 16 controller outputs (control_bits), the
+controller step and registers A and B once per clock cycle, after the
+falling edge, into fixed size records. Records are collected in a NumPy
+array and written out a whole chunk at a time.
+
+The file is a 16 byte header (MAGIC, version, record size) followed by
+the records. TraceFile memory-maps it, and returns NumPy views of any
+range of cycles without reading the rest of the file.
+
+The bus, A and B fields are the smallest type that holds a word of the
+sap's DATA_WIDTH, a byte by default: capture and read the trace of a
+wider sap with its widths.
+"""
+import os
+import struct
+
+import numpy as np
+
+from lib.model import ADDRESS_WIDTH, data_width_of, word_type
+from lib.util import handle
+
+MAGIC = b'SAPTRACE'
+VERSION = 1
+_HEADER = struct.Struct('<8sII')
+HEADER_SIZE = _HEADER.size
+
+
+
+def record(address_width=ADDRESS_WIDTH, data_width=None):
+    """The NumPy dtype of one cycle's record"""
+    word = word_type(data_width_of(address_width, data_width))
+    return np.dtype([
+        ('cycle', '<u4'),
+        ('control', '<u2'),
+        ('bus', word),
+        ('step', 'u1'),
+        ('a', word),
+        ('b', word),
+        ('undefined', 'u1'), # UNDEFINED bit set for each field holding x/z
+        ('pad', 'u1'),
+    ])
+
+
+RECORD = record()
+
+# (record field, DUT signal path) sampled each cycle:
+SIGNALS = (
+    ('control', 'control.control_bits'),
+    ('bus', 'bus'),
+    ('step', 'control.step'),
+    ('a', 'register_A.data'),
+    ('b', 'register_B.data'),
+)
+UNDEFINED = {name: 1 << index for index, (name, path) in enumerate(SIGNALS)}
+
+DEFAULT_CHUNK = 1 << 16 # records per write
+
+
+class Capture(object):
+    """Samples one sap DUT every clock cycle into a binary trace file"""
+
+    def __init__(self, dut, path, chunk=DEFAULT_CHUNK, address_width=ADDRESS_WIDTH,
+                 data_width=None):
+        self.dut = dut
+        self.path = path
+        self.fields = tuple((name, handle(dut, signal), UNDEFINED[name])
+                            for name, signal in SIGNALS)
+        dtype = record(address_width, data_width)
+        self.buffer = np.zeros(chunk, dtype=dtype)
+        self.used = 0
+        self.cycle = 0
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(MAGIC, VERSION, dtype.itemsize))
+
+    def sample(self):
+        """Record the current values as the next cycle"""
+        self.cycle += 1
+        record = self.buffer[self.used]
+        record['cycle'] = self.cycle
+        undefined = 0
+        for name, signal, bit in self.fields:
+            value = signal.value
+            if value.is_resolvable:
+                record[name] = value.integer
+            else:
+                record[name] = 0
+                undefined |= bit
+        record['undefined'] = undefined
+        self.used += 1
+        if self.used == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer[:self.used].tobytes())
+        self.file.flush()
+        self.used = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def monitor(self):
+        """Sample after every falling edge of i_clock, until closed"""
+        # Imported here, so TraceFile can be used without cocotb:
+        from cocotb.triggers import FallingEdge, ReadOnly
+        clock = self.dut.i_clock
+        while not self.file.closed:
+            yield FallingEdge(clock)
+            yield ReadOnly()
+            if not self.file.closed:
+                self.sample()
+
+    def start(self):
+        """Fork the monitor; close() the capture to stop it and write the rest"""
+        import cocotb
+        return cocotb.fork(cocotb.coroutine(self.monitor)())
+
+
+class TraceFile(object):
+    """A memory-mapped capture file, eg. TraceFile(path).cycles(1000, 2000)['bus']"""
+
+    def __init__(self, path, address_width=ADDRESS_WIDTH, data_width=None):
+        dtype = record(address_width, data_width)
+        with open(path, 'rb') as header:
+            magic, version, size = _HEADER.unpack(header.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError('%s is not a sap capture file' % path)
+        if version != VERSION or size != dtype.itemsize:
+            raise ValueError('%s is capture version %d with %d byte records, expected %d and %d'
+                             % (path, version, size, VERSION, dtype.itemsize))
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def cycles(self, first, last=None):
+        """View of the records for cycles first to last, inclusive"""
+        if last is None:
+            last = first
+        column = self.records['cycle']
+        start = np.searchsorted(column, first, side='left')
+        stop = np.searchsorted(column, last, side='right')
+        return self.records[start:stop]
+
+    def defined(self, records, name):
+        """Boolean array of which records hold a defined value for name"""
+        return (records['undefined'] & UNDEFINED[name]) == 0
@@ -0,0 +1,133 @@
+"""
+Architectural state checkpoints of a running sap DUT.
+
+capture() reads every register of the computer, and all of RAM, into a
+Checkpoint; restore() deposits one back through the handle hierarchy,
+taking no simulation time. A scenario can then start from a warmed-up
+state, eg. reset and programmed, without simulating its way there again.
+
+Take checkpoints between clock cycles, with i_clock low, as clock() and
+run_until_halt() leave it. A value holding any x or z bits is captured as
+None, and restored as all z.
+
+The register and RAM widths follow sap.v's ADDRESS_WIDTH and DATA_WIDTH,
+which default to lib.model's; pass the same widths to capture, restore
+and serialize a checkpoint of a wider sap.
+"""
+import functools
+import struct
+from collections import namedtuple
+
+from lib.model import ADDRESS_WIDTH, data_width_of
+from lib.util import handle
+
+
+def state(address_width=ADDRESS_WIDTH, data_width=None):
+    """(field, bit width, DUT signal path) for each register"""
+    data_width = data_width_of(address_width, data_width)
+    return (
+        ('pc', address_width, 'pc.count'),
+        ('pc_out', data_width, 'pc.count_buffer'),
+        ('mar', address_width, 'mar.address'),
+        ('opcode', 4, 'ir.hiNib'),
+        ('operand', data_width - 4, 'ir.loNib'),
+        ('a', data_width, 'register_A.data'),
+        ('b', data_width, 'register_B.data'),
+        ('out', data_width, 'register_OUT.data'),
+        ('step', 3, 'control.step'),
+        ('control', 16, 'control.control_bits'),
+        ('alu', data_width, 'alu.result'),
+        ('overflow', 1, 'alu.overflow_flag'),
+        ('zero', 1, 'alu.zero_flag'),
+    )
+
+
+STATE = state()
+FIELDS = tuple(name for name, width, path in STATE)
+
+
+def _code(width):
+    return 'B' if width <= 8 else 'H' if width <= 16 else 'I'
+
+
+@functools.lru_cache()
+def _format(address_width=ADDRESS_WIDTH, data_width=None):
+    # Serialized as masks of the defined registers and RAM words (a byte
+    # per 8 words), then every register and RAM word:
+    data_width = data_width_of(address_width, data_width)
+    size = 1 << address_width
+    return struct.Struct('<H%ds' % ((size + 7) // 8)
+                         + ''.join(_code(width) for n, width, p in state(address_width, data_width))
+                         + '%d%s' % (size, _code(data_width)))
+
+
+class Checkpoint(namedtuple('Checkpoint', FIELDS + ('ram',))):
+    """Register values (None if undefined) and a tuple of RAM words"""
+    __slots__ = ()
+
+    def to_bytes(self, address_width=ADDRESS_WIDTH, data_width=None):
+        registers = [getattr(self, name) for name in FIELDS]
+        words = (len(self.ram) + 7) // 8
+        return _format(address_width, data_width).pack(
+            _mask(registers), _mask(self.ram).to_bytes(words, 'little'),
+            *[v or 0 for v in registers + list(self.ram)])
+
+    @classmethod
+    def from_bytes(cls, data, address_width=ADDRESS_WIDTH, data_width=None):
+        values = _format(address_width, data_width).unpack(data)
+        registers, ram = values[2:2 + len(FIELDS)], values[2 + len(FIELDS):]
+        return cls(*_unmask(values[0], registers),
+                   ram=tuple(_unmask(int.from_bytes(values[1], 'little'), ram)))
+
+
+def _mask(values):
+    return sum(1 << i for i, value in enumerate(values) if value is not None)
+
+
+def _unmask(mask, values):
+    return [value if mask >> i & 1 else None for i, value in enumerate(values)]
+
+
+def _read(signal):
+    value = signal.value
+    return value.integer if value.is_resolvable else None
+
+
+class Checkpointer(object):
+    """Captures and restores one DUT, with its handles looked up once"""
+
+    def __init__(self, dut, address_width=ADDRESS_WIDTH, data_width=None):
+        self.data_width = data_width_of(address_width, data_width)
+        self.registers = [(handle(dut, path), width)
+                          for name, width, path in state(address_width, self.data_width)]
+        self.ram = [dut.ram.ram[address] for address in range(1 << address_width)]
+
+    def capture(self):
+        return Checkpoint(*[_read(signal) for signal, width in self.registers],
+                          ram=tuple(_read(word) for word in self.ram))
+
+    def restore(self, checkpoint):
+        values = [getattr(checkpoint, name) for name in FIELDS]
+        for (signal, width), value in zip(self.registers, values):
+            _deposit(signal, width, value)
+        for word, value in zip(self.ram, checkpoint.ram):
+            _deposit(word, self.data_width, value)
+
+
+def _deposit(signal, width, value):
+    if value is None:
+        # Imported here, so Checkpoints can be made and stored without cocotb:
+        from cocotb.binary import BinaryValue
+        signal.setimmediatevalue(BinaryValue('z' * width))
+    else:
+        signal.setimmediatevalue(value)
+
+
+def capture(dut, address_width=ADDRESS_WIDTH, data_width=None):
+    """Capture the architectural state of a sap DUT"""
+    return Checkpointer(dut, address_width, data_width).capture()
+
+
+def restore(dut, checkpoint, address_width=ADDRESS_WIDTH, data_width=None):
+    """Deposit a Checkpoint into a sap DUT"""
+    Checkpointer(dut, address_width, data_width).restore(checkpoint)
@@ -0,0 +1,189 @@
+"""
+Program corpus: a directory of assembler sources, compiled into one file.
+
+The corpus file is the sources' RAM images back to back, STRIDE bytes
+each, in order of their path under the directory: the same format as a
+lib.farm images file, so a corpus can be run with python -m lib.farm.
+Beside it, CORPUS.json lists each image's name (its source's path) and
+the sha256 of the source it was assembled from. build() only assembles
+sources whose hash has changed, and copies the other images over from
+the old corpus.
+
+Corpus memory-maps the file, so a testbench indexes an image by number
+or name without parsing or opening anything per program.
+
+Images are for a sap of lib.model's ADDRESS_WIDTH and DATA_WIDTH by
+default; a corpus for a wider one is built and read with its widths,
+and its images' words are little endian (see lib.model.as_images).
+
+Usage: python -m lib.corpus [--address-width N] build SOURCES CORPUS
+       python -m lib.corpus [--address-width N] list CORPUS
+       python -m lib.corpus [--address-width N] show CORPUS NAME|INDEX
+"""
+import argparse
+import hashlib
+import json
+import numbers
+import os
+import sys
+
+import numpy as np
+
+from lib.assembler import assemble, disassemble
+from lib.model import ADDRESS_WIDTH, as_images, data_width_of, image_size, word_type
+
+STRIDE = image_size() # bytes per image
+VERSION = 1 # of the assembler and manifest: older corpora are rebuilt in full
+SUFFIX = '.asm'
+
+
+def manifest_path(path):
+    return path + '.json'
+
+
+def sources(directory):
+    """Relative paths of the assembler sources under directory, sorted"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in files:
+            if name.endswith(SUFFIX):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(found)
+
+
+def _read_manifest(path, stride=STRIDE):
+    try:
+        with open(manifest_path(path)) as manifest:
+            manifest = json.load(manifest)
+    except (IOError, ValueError):
+        return None
+    if manifest.get('version') != VERSION or manifest.get('stride') != stride:
+        return None
+    return manifest
+
+
+def build(directory, path, address_width=ADDRESS_WIDTH, data_width=None):
+    """
+    Assemble every source under directory into the corpus at path,
+    reusing the images of unchanged sources. Returns (assembled, reused).
+    """
+    data_width = data_width_of(address_width, data_width)
+    stride = image_size(address_width, data_width)
+    old = {}
+    manifest = _read_manifest(path, stride)
+    if manifest is not None and os.path.exists(path):
+        images = Corpus(path, address_width, data_width)
+        if len(images) == len(manifest['programs']):
+            old = {(program['name'], program['sha256']): images[index]
+                   for index, program in enumerate(manifest['programs'])}
+    programs = []
+    assembled = reused = 0
+    try:
+        with open(path + '.tmp', 'wb') as out:
+            for name in sources(directory):
+                with open(os.path.join(directory, name), 'rb') as source:
+                    text = source.read()
+                digest = hashlib.sha256(text).hexdigest()
+                image = old.get((name, digest))
+                if image is None:
+                    image = as_images(assemble(text.decode(), name, 1 << address_width, data_width),
+                                      address_width, data_width).tobytes()
+                    assembled += 1
+                else:
+                    reused += 1
+                out.write(image)
+                programs.append({'name': name, 'sha256': digest})
+        with open(manifest_path(path) + '.tmp', 'w') as out:
+            json.dump({'version': VERSION, 'stride': stride, 'programs': programs}, out, indent=1)
+        # Replaced together at the end, so a failed build leaves the old corpus:
+        os.replace(path + '.tmp', path)
+        os.replace(manifest_path(path) + '.tmp', manifest_path(path))
+    finally:
+        # Whatever went wrong, eg. a source that does not assemble:
+        for temporary in (path + '.tmp', manifest_path(path) + '.tmp'):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    return assembled, reused
+
+
+class Corpus(object):
+    """The images of a corpus file, memory-mapped, by index or name"""
+
+    def __init__(self, path, address_width=ADDRESS_WIDTH, data_width=None):
+        self.path = path
+        word = word_type(data_width_of(address_width, data_width))
+        words = 1 << address_width
+        stride = words * word.itemsize
+        size = os.path.getsize(path)
+        if size % stride:
+            raise ValueError('%s is %d bytes, not a whole number of %d byte images'
+                             % (path, size, stride))
+        if size:
+            self.images = np.memmap(path, dtype=word, mode='r', shape=(size // stride, words))
+        else:
+            self.images = np.zeros((0, words), dtype=word)
+        manifest = _read_manifest(path, stride)
+        self.names = [program['name'] for program in manifest['programs']] if manifest else []
+        self._indices = {name: index for index, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, key):
+        """The image at an index, or of a source name, as bytes"""
+        if not isinstance(key, numbers.Integral):
+            key = self.index(key)
+        return self.images[key].tobytes()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def index(self, name):
+        if name not in self._indices:
+            raise KeyError('%s is not in %s' % (name, self.path))
+        return self._indices[name]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--address-width', type=int, default=ADDRESS_WIDTH,
+                        help='of the sap the images are for (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('build', help='assemble a directory of sources into a corpus')
+    command.add_argument('sources', help='directory of %s sources' % SUFFIX)
+    command.add_argument('corpus', help='corpus file to write')
+    command = commands.add_parser('list', help='list the programs of a corpus')
+    command.add_argument('corpus')
+    command = commands.add_parser('show', help='disassemble one program of a corpus')
+    command.add_argument('corpus')
+    command.add_argument('program', help='source name, or index')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        try:
+            assembled, reused = build(args.sources, args.corpus, args.address_width)
+        except ValueError as error:
+            sys.stderr.write('%s\n' % error)
+            return 1
+        print('%s: %d programs, %d assembled, %d unchanged'
+              % (args.corpus, assembled + reused, assembled, reused))
+    elif args.command == 'list':
+        corpus = Corpus(args.corpus, args.address_width)
+        for index in range(len(corpus)):
+            print('%6d %s' % (index, corpus.names[index] if index < len(corpus.names) else ''))
+    elif args.command == 'show':
+        corpus = Corpus(args.corpus, args.address_width)
+        program = int(args.program) if args.program.isdigit() else args.program
+        data_width = data_width_of(args.address_width)
+        sys.stdout.write(disassemble(as_images(corpus[program], args.address_width)[0].tolist(),
+                                     data_width))
+    else:
+        parser.print_usage()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Functional coverage of the sap computer.
+
+Every clock cycle, after the falling edge, a Collector samples:
+  microcode  - the controller's inputs: opcode x step x carry x zero
+  bus_driver - which of the units that can drive the bus are enabled
+  ram_read   - the RAM address read onto the bus
+  ram_write  - the RAM address written from the bus
+  alu        - subtract x overflow x zero, when the ALU drives the bus
+
+Each space is a fixed range of bins in one array of counters, so sampling
+is a few integer operations. Coverage files hold a bitmap of the bins hit
+as well as the counts: merging the files of many parallel runs is a
+bitwise OR of their bitmaps (and a sum of their counts).
+
+Holes are reported against the bins lib.isa says are reachable: the
+(opcode, step) pairs controller.v has a case for, and one bus driver at
+a time. Hits in other bins, eg. two units driving the bus at once, are
+reported as illegal.
+
+The RAM spaces have a bin per word, so coverage of a sap with a wider
+ADDRESS_WIDTH has its own layout of bins: pass the same address_width
+to everything that counts, reads or merges it.
+
+Usage: python -m lib.coverage report FILE ...
+       python -m lib.coverage merge OUTPUT FILE ...
+"""
+import argparse
+import functools
+import struct
+import sys
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from lib import isa
+from lib.model import ADDRESS_WIDTH
+from lib.util import handle
+
+# The bus drivers, each with one bit of the bus_driver bin number:
+DRIVERS = ((isa.CO, 'CO'), (isa.RO, 'RO'), (isa.IO, 'IO'), (isa.AO, 'AO'), (isa.EO, 'EO'))
+
+Layout = namedtuple('Layout', ('spaces', 'offsets', 'bins', 'legal'))
+
+_MAGIC = b'SAPCOVER'
+_HEADER = struct.Struct('<8sI')
+
+
+@functools.lru_cache()
+def layout(address_width=ADDRESS_WIDTH):
+    """The Layout of the bins for a sap with 2**address_width words of RAM"""
+    spaces = OrderedDict((
+        ('microcode', len(isa.MICROCODE)),
+        ('bus_driver', 1 << len(DRIVERS)),
+        ('ram_read', 1 << address_width),
+        ('ram_write', 1 << address_width),
+        ('alu', 8),
+    ))
+    offsets = {}
+    offset = 0
+    for name, size in spaces.items():
+        offsets[name] = offset
+        offset += size
+    return Layout(spaces, offsets, offset, _legal(spaces, offsets, offset))
+
+
+def _legal(spaces, offsets, bins):
+    """Boolean array of the reachable bins"""
+    legal = np.zeros(bins, dtype=bool)
+    for opcode in isa.MNEMONICS:
+        for step in range(isa.STEPS):
+            for carry in (0, 1):
+                for zero in (0, 1):
+                    index = isa.microcode_index(opcode, step, carry, zero)
+                    if isa.MICROCODE[index] is not None:
+                        legal[offsets['microcode'] + index] = True
+    legal[offsets['bus_driver']] = True # Nothing driving the bus
+    for bit in range(len(DRIVERS)):
+        legal[offsets['bus_driver'] + (1 << bit)] = True
+    for name in ('ram_read', 'ram_write', 'alu'):
+        legal[offsets[name]:offsets[name] + spaces[name]] = True
+    return legal
+
+SPACES, OFFSETS, BINS, LEGAL = layout()
+
+
+def describe(index, address_width=ADDRESS_WIDTH):
+    """Name a bin, eg. 'microcode ADD step 3 carry 0 zero 1'"""
+    spaces, offsets = layout(address_width)[:2]
+    for name, size in spaces.items():
+        offset = index - offsets[name]
+        if 0 <= offset < size:
+            break
+    if name == 'microcode':
+        opcode, step, carry, zero = offset >> 5, offset >> 2 & 7, offset >> 1 & 1, offset & 1
+        return 'microcode %s step %d carry %d zero %d' % (
+            isa.MNEMONICS.get(opcode, format(opcode, '04b')), step, carry, zero)
+    if name == 'bus_driver':
+        drivers = [n for bit, (control, n) in enumerate(DRIVERS) if offset >> bit & 1]
+        return 'bus_driver %s' % ('|'.join(drivers) or 'none')
+    if name == 'alu':
+        return 'alu %s overflow %d zero %d' % ('SUB' if offset >> 2 else 'ADD',
+                                               offset >> 1 & 1, offset & 1)
+    return '%s address %x' % (name, offset)
+
+
+class Coverage(object):
+    """Hit counts for every bin"""
+
+    def __init__(self, counts=None, address_width=ADDRESS_WIDTH):
+        self.address_width = address_width
+        self.layout = layout(address_width)
+        self.counts = np.zeros(self.layout.bins, dtype=np.uint64) if counts is None else counts
+
+    def sample(self, control, opcode, step, carry, zero, mar):
+        """Count one clock cycle's bins"""
+        counts = self.counts
+        offsets = self.layout.offsets
+        counts[(((opcode << 3 | step) << 2) | carry << 1 | zero)] += 1
+        drivers = 0
+        for bit, (signal, name) in enumerate(DRIVERS):
+            if control & signal:
+                drivers |= 1 << bit
+        counts[offsets['bus_driver'] + drivers] += 1
+        if control & isa.RO:
+            counts[offsets['ram_read'] + mar] += 1
+        if control & isa.RI:
+            counts[offsets['ram_write'] + mar] += 1
+        if control & isa.EO:
+            subtract = 1 if control & isa.SU else 0
+            counts[offsets['alu'] + (subtract << 2 | carry << 1 | zero)] += 1
+
+    @property
+    def bitmap(self):
+        return np.packbits(self.counts > 0)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def save(self, path):
+        with open(path, 'wb') as out:
+            out.write(_HEADER.pack(_MAGIC, self.layout.bins))
+            out.write(self.bitmap.tobytes())
+            out.write(self.counts.astype('<u8').tobytes())
+
+    @classmethod
+    def load(cls, path, address_width=ADDRESS_WIDTH):
+        bitmap, counts = read(path, address_width)
+        return cls(counts.astype(np.uint64), address_width)
+
+    def holes(self):
+        """Reachable bins never hit"""
+        return [describe(i, self.address_width)
+                for i in np.nonzero(self.layout.legal & (self.counts == 0))[0]]
+
+    def illegal(self):
+        """Unreachable bins that were hit, with their counts"""
+        return [(describe(i, self.address_width), int(self.counts[i]))
+                for i in np.nonzero(~self.layout.legal & (self.counts > 0))[0]]
+
+    def summary(self):
+        """[(space, bins hit, reachable bins)]"""
+        spaces, offsets, bins, legal = self.layout
+        hit = (self.counts > 0) & legal
+        return [(name, int(hit[offsets[name]:offsets[name] + size].sum()),
+                 int(legal[offsets[name]:offsets[name] + size].sum()))
+                for name, size in spaces.items()]
+
+    def report(self, out=sys.stdout, holes=True):
+        total_hit = total = 0
+        for name, hit, reachable in self.summary():
+            out.write('%-10s %4d / %-4d %5.1f%%\n' % (name, hit, reachable,
+                                                     100.0 * hit / reachable))
+            total_hit, total = total_hit + hit, total + reachable
+        out.write('%-10s %4d / %-4d %5.1f%%\n' % ('total', total_hit, total,
+                                                 100.0 * total_hit / total))
+        for name, count in self.illegal():
+            out.write('ILLEGAL: %s (%d cycles)\n' % (name, count))
+        if holes:
+            for name in self.holes():
+                out.write('hole: %s\n' % name)
+
+
+def read(path, address_width=ADDRESS_WIDTH):
+    """Read a coverage file as (bitmap, counts) arrays"""
+    expected = layout(address_width).bins
+    with open(path, 'rb') as coverage:
+        magic, bins = _HEADER.unpack(coverage.read(_HEADER.size))
+        if magic != _MAGIC or bins != expected:
+            raise ValueError('%s is not a coverage file with %d bins' % (path, expected))
+        bitmap = np.frombuffer(coverage.read((bins + 7) // 8), dtype=np.uint8)
+        counts = np.frombuffer(coverage.read(8 * bins), dtype='<u8')
+    return bitmap, counts
+
+
+def merge(paths, address_width=ADDRESS_WIDTH):
+    """Merge coverage files: returns (OR of their bitmaps, Coverage of summed counts)"""
+    bitmaps, counts = zip(*[read(path, address_width) for path in paths])
+    return (np.bitwise_or.reduce(bitmaps),
+            Coverage(np.sum(counts, axis=0, dtype=np.uint64), address_width))
+
+
+class Collector(object):
+    """Samples one sap DUT into a Coverage every clock cycle"""
+
+    SIGNALS = ('control.control_bits', 'ir.hiNib', 'control.step',
+               'alu.overflow_flag', 'alu.zero_flag', 'mar.address')
+
+    def __init__(self, dut, coverage=None, address_width=ADDRESS_WIDTH):
+        self.dut = dut
+        self.coverage = coverage or Coverage(address_width=address_width)
+        self.handles = tuple(handle(dut, path) for path in self.SIGNALS)
+        self.running = False
+
+    def sample(self):
+        values = []
+        for signal in self.handles:
+            value = signal.value
+            if not value.is_resolvable:
+                return # Not out of reset yet
+            values.append(value.integer)
+        self.coverage.sample(*values)
+
+    def monitor(self):
+        # Imported here, so coverage files can be merged without cocotb:
+        from cocotb.triggers import FallingEdge, ReadOnly
+        clock = self.dut.i_clock
+        while self.running:
+            yield FallingEdge(clock)
+            yield ReadOnly()
+            if self.running:
+                self.sample()
+
+    def start(self):
+        """Fork the monitor, sampling until stop()"""
+        import cocotb
+        self.running = True
+        return cocotb.fork(cocotb.coroutine(self.monitor)())
+
+    def stop(self):
+        self.running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    report = commands.add_parser('report', help='show coverage and holes of merged files')
+    report.add_argument('files', nargs='+')
+    report.add_argument('--no-holes', action='store_true', help='only show the summary')
+    merge_command = commands.add_parser('merge', help='merge files into one')
+    merge_command.add_argument('output')
+    merge_command.add_argument('files', nargs='+')
+    for command in (report, merge_command):
+        command.add_argument('--address-width', type=int, default=ADDRESS_WIDTH,
+                             help='of the sap the files were collected on (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('report or merge?')
+
+    bitmap, coverage = merge(args.files, args.address_width)
+    if args.command == 'merge':
+        coverage.save(args.output)
+        print('Merged %d files into %s' % (len(args.files), args.output))
+    else:
+        coverage.report(holes=not args.no_holes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
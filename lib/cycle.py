@@ -2,14 +2,19 @@
 Drivers to cycle common module inputs.
 Cycle means setting a value high, waiting, then setting back to low.
 """
-from cocotb.triggers import Timer
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import Timer, RisingEdge, FallingEdge, First, ReadOnly
+from cocotb.utils import get_sim_time
 
-# Perform the clock counting in Python to avoid race in Verilog debugging:
-clock_count = 0
+from lib import profiler, trace
 
 def wait():
     """Wait for the simulation, without cycling anything."""
-    yield Timer(1)
+    if profiler.enabled:
+        yield from profiler.timed(Timer(1))
+    else:
+        yield Timer(1)
         
 def cycle(dut, n=1, signals=('i_clock',)):
     """Cycle a signal n times"""
@@ -23,14 +28,74 @@ def cycle(dut, n=1, signals=('i_clock',)):
 
 def clock(dut, n=1):
     """Cycle the i_clock input signal n times"""
-    global clock_count
+    # Perform the clock counting in Python to avoid race in Verilog debugging:
+    recorder = trace.recorder(dut)
     for i in range(n):
-        clock_count += 1
-        print("DEBUG: -------------------------------")
-        print("DEBUG: Clock cycle : %d" % clock_count)
+        recorder.record()
         yield from cycle(dut, 1, signals=('i_clock',))
         
 def reset(dut, n=1):
     """Cycle the i_reset input signal n times"""
     yield from cycle(dut, n, signals=('i_reset',))
 
+def halt_signal(dut):
+    """Find the halt line: ctl_halt in the whole system, o_halt in the controller"""
+    for name in ('ctl_halt', 'o_halt'):
+        if hasattr(dut, name):
+            return getattr(dut, name)
+    raise AttributeError('%s has no ctl_halt or o_halt signal' % dut._name)
+
+def run_until_halt(dut, max_cycles=10000, until=None, halt=None, period=2):
+    """
+    Run i_clock from a simulator side clock until the halt signal rises,
+    until(dut) returns True after a cycle, or max_cycles have elapsed.
+    Returns the number of clock cycles run. Like clock(), it always stops
+    after the falling edge, leaving i_clock low, and once the units that
+    act on the falling edge (the PC, the ALU) have settled.
+    """
+    if halt is None:
+        halt = halt_signal(dut)
+
+    def halted():
+        return halt.value.is_resolvable and halt.value.integer == 1
+
+    if halted():
+        return 0
+    clock_thread = cocotb.fork(Clock(dut.i_clock, period).start())
+    # Like wait(), each yield goes through the profiler only when it is
+    # enabled, which keeps the per cycle loop cheap otherwise:
+    falling_edge = FallingEdge(dut.i_clock)
+    cycles = 0
+    if until is None:
+        # Nothing to check between cycles, so let the simulator run freely
+        # until halt, or until the falling edge of the last cycle:
+        start = get_sim_time()
+        end = First(RisingEdge(halt), Timer((max_cycles - 1) * period + period // 2))
+        if profiler.enabled:
+            yield from profiler.timed(end)
+        else:
+            yield end
+        elapsed = get_sim_time() - start
+        cycles = min(max_cycles, elapsed // period + 1)
+        if elapsed % period < period // 2:
+            # Halted just after a rising edge; finish the cycle:
+            if profiler.enabled:
+                yield from profiler.timed(falling_edge)
+            else:
+                yield falling_edge
+        yield ReadOnly()
+    else:
+        while cycles < max_cycles:
+            if profiler.enabled:
+                yield from profiler.timed(falling_edge)
+            else:
+                yield falling_edge
+            yield ReadOnly()
+            cycles += 1
+            if halted() or until(dut):
+                break
+    clock_thread.kill()
+    # Out of the read only phase, so the caller can drive inputs again:
+    yield Timer(1)
+    trace.recorder(dut).skip(cycles)
+    return cycles
@@ -0,0 +1,150 @@
+"""
+Program farm: run many RAM images through one sap simulation.
+
+The program_farm test in sap_test.py resets the computer once, then for each
+image restores that reset state with the image in RAM, runs it until it
+halts, and appends its final state to a results file as a line of JSON.
+Every image shares one simulator launch, instead of paying for simulator
+startup and cocotb initialisation each.
+
+Images are 16 byte RAM images, back to back in a binary file; or for a
+sap of other widths, images of its 2**ADDRESS_WIDTH words, little endian.
+
+Usage: python -m lib.farm [--max-cycles N] [--output FILE] IMAGES
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from lib.model import ADDRESS_WIDTH, as_images, data_width_of, image_size
+from lib.util import handle
+
+SAP_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(SAP_HOME, 'farm_build')
+DEFAULT_MAX_CYCLES = 1000
+
+# Registers that i_reset leaves alone (or resets to z), which lib.model
+# starts at 0. Cleared so every image starts from the model's state:
+CLEARED = ('control.control_bits', 'register_A.data', 'register_B.data',
+           'register_OUT.data', 'alu.result', 'alu.overflow_flag', 'alu.zero_flag')
+
+
+def read_images(path, address_width=ADDRESS_WIDTH, data_width=None):
+    """Split a file of back to back RAM images into a list of bytes"""
+    size = image_size(address_width, data_width)
+    with open(path, 'rb') as images:
+        data = images.read()
+    if len(data) % size:
+        raise ValueError('%s is %d bytes, not a whole number of %d byte images'
+                         % (path, len(data), size))
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def write_images(images, path, address_width=ADDRESS_WIDTH, data_width=None):
+    """Write RAM images, each bytes or a sequence of words, back to back"""
+    with open(path, 'wb') as out:
+        for image in images:
+            out.write(as_images(image, address_width, data_width).tobytes())
+
+
+def read_results(path):
+    """Yield each program's result from a results file, as far as it goes"""
+    with open(path) as results:
+        for line in results:
+            if line.endswith('\n'):
+                yield json.loads(line)
+
+
+def run(dut, images, results, max_cycles=DEFAULT_MAX_CYCLES, address_width=ADDRESS_WIDTH,
+        data_width=None):
+    """
+    Run each image in turn from the DUT's reset state, writing one line
+    of JSON to the results file as each finishes:
+      index, halt_cycles (-1 if it didn't halt), display, a, b, pc, ram
+    Registers holding x/z bits are recorded as null. Images are bytes, as
+    read_images() splits them, for a sap of the given widths.
+    """
+    # Imported here, so the launcher does not need cocotb:
+    from lib.checkpoint import Checkpointer
+    from lib.cycle import wait, run_until_halt
+
+    halt = dut.ctl_halt
+    for path in CLEARED:
+        handle(dut, path).setimmediatevalue(0)
+    yield from wait()
+    data_width = data_width_of(address_width, data_width)
+    checkpointer = Checkpointer(dut, address_width, data_width)
+    initial = checkpointer.capture()
+    for index, image in enumerate(images):
+        ram = as_images(image, address_width, data_width)[0].tolist()
+        checkpointer.restore(initial._replace(ram=tuple(ram)))
+        yield from wait()
+        cycles = yield from run_until_halt(dut, max_cycles=max_cycles, halt=halt)
+        state = checkpointer.capture()
+        halted = halt.value.is_resolvable and halt.value.integer == 1
+        results.write(json.dumps({
+            'index': index,
+            'halt_cycles': cycles if halted else -1,
+            'display': state.out,
+            'a': state.a,
+            'b': state.b,
+            'pc': state.pc,
+            'ram': list(state.ram),
+        }) + '\n')
+        results.flush()
+    return len(images)
+
+
+def launch(images_path, results_path, build_dir=BUILD_DIR, max_cycles=DEFAULT_MAX_CYCLES,
+           log=None, coverage=None):
+    """
+    Run the program_farm test over a file of images in its own simulator,
+    and optionally save its functional coverage. Returns make's status.
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    log = log or os.path.join(build_dir, 'sim.log')
+    env = dict(os.environ, PWD=SAP_HOME, TESTCASE='program_farm',
+               SAP_FARM_IMAGES=os.path.abspath(images_path),
+               SAP_FARM_RESULTS=os.path.abspath(results_path),
+               SAP_FARM_MAX_CYCLES=str(max_cycles),
+               COCOTB_RESULTS_FILE=os.path.join(build_dir, 'results.xml'))
+    if coverage:
+        env['SAP_COVERAGE'] = os.path.abspath(coverage)
+    for path in (results_path, coverage):
+        if path and os.path.exists(path):
+            os.remove(path)
+    with open(log, 'w') as output:
+        return subprocess.call(['make', 'sim', 'SIM_BUILD=%s' % os.path.join(build_dir, 'sim_build')],
+                               cwd=SAP_HOME, env=env, stdout=output, stderr=subprocess.STDOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('images', help='file of 16 byte RAM images')
+    parser.add_argument('--output', default=None,
+                        help='results file (default: BUILD_DIR/results.jsonl)')
+    parser.add_argument('--max-cycles', type=int, default=DEFAULT_MAX_CYCLES,
+                        help='cycles to run images that never halt (default: %(default)s)')
+    parser.add_argument('--build-dir', default=BUILD_DIR,
+                        help='sim_build and log directory (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    count = len(read_images(args.images))
+    output = args.output or os.path.join(args.build_dir, 'results.jsonl')
+    start = time.time()
+    status = launch(args.images, output, args.build_dir, args.max_cycles)
+    elapsed = time.time() - start
+    done = sum(1 for result in read_results(output)) if os.path.exists(output) else 0
+    print('%d of %d programs in %.1fs (%.0f/s), results in %s' % (
+        done, count, elapsed, done / elapsed if elapsed else 0, output))
+    if status != 0 or done != count:
+        print('Farm failed, see %s' % os.path.join(args.build_dir, 'sim.log'))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Constrained-random program fuzzer for the whole SAP computer.
+
+Generates random 16 byte programs, weighted toward the instructions the
+controller implements, and runs them in batches through the RTL (see
+lib.farm), several simulators at once. Each program's final state
+is checked against lib.model, and every mismatch is shrunk to a minimal
+program that still shows it.
+
+The functional coverage of all the programs run is summarised at the
+end, and saved in BUILD_DIR/coverage.bin for lib.coverage to report on.
+
+Program N of a run is generated from its own seed, 'SEED:N', so a failure
+can be regenerated on its own with --seed SEED --index N.
+
+Usage: python -m lib.fuzz [-j JOBS] [--seed SEED] [--programs N] [--image FILE]
+"""
+import argparse
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lib import farm, isa
+from lib.coverage import Coverage
+from lib.memory import read_image
+from lib.model import RAM_SIZE, SAPModel
+
+SAP_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILD_DIR = os.path.join(SAP_HOME, 'fuzz_build')
+
+# Relative weight of each instruction in generated code; NOP stands in
+# for the undefined opcodes, which all stall the controller. LDI and the
+# jumps are weighted like the rest: sap.v zero extends the IR operand and
+# wires J to the PC, so the model agrees with it on them too:
+WEIGHTS = {
+    isa.NOP: 1, isa.LDA: 4, isa.ADD: 4, isa.SUB: 4, isa.STA: 2, isa.LDI: 2,
+    isa.JMP: 1, isa.JC: 1, isa.JZ: 1, isa.OUT: 3, isa.HLT: 1,
+}
+
+# Final state compared between the RTL and the model:
+FIELDS = ('halt_cycles', 'display', 'a', 'b', 'pc', 'ram')
+
+Failure = namedtuple('Failure', ('program', 'fields', 'expected', 'actual'))
+
+
+def generate(rng, weights=WEIGHTS):
+    """One random RAM image: a run of instructions, followed by data"""
+    opcodes = sorted(weights)
+    code = rng.choices(opcodes, [weights[o] for o in opcodes], k=rng.randint(1, RAM_SIZE))
+    program = [opcode << 4 | rng.randrange(16) for opcode in code]
+    program.extend(rng.randrange(256) for i in range(RAM_SIZE - len(program)))
+    return bytes(program)
+
+
+def program(seed, index, weights=WEIGHTS):
+    """Regenerate program index of the run with the given seed"""
+    return generate(random.Random('%d:%d' % (seed, index)), weights)
+
+
+def listing(image):
+    """Disassemble a RAM image, one 'address: byte mnemonic operand' per line"""
+    lines = []
+    for address, byte in enumerate(image):
+        name = isa.MNEMONICS.get(byte >> 4, '???')
+        lines.append('%x: %s  %-3s %x  (%d)' % (address, format(byte, '08b'), name,
+                                                byte & 0x0f, byte))
+    return '\n'.join(lines)
+
+
+def expected(images, max_cycles):
+    """Final state of each image in the model, in the testbench's format"""
+    model = SAPModel(np.array([list(image) for image in images], dtype=np.uint8))
+    while model.cycle < max_cycles and not model.halted.all():
+        model.clock()
+    return [{'halt_cycles': int(model.halt_cycles[i]), 'display': int(model.out[i]),
+             'a': int(model.a[i]), 'b': int(model.b[i]), 'pc': int(model.pc[i]),
+             'ram': model.ram[i].tolist()} for i in range(len(model))]
+
+
+def mismatches(expected, actual):
+    return tuple(field for field in FIELDS if expected[field] != actual[field])
+
+
+class Simulators(object):
+    """
+    A pool of simulator slots, each with its own sim_build directory, that
+    run batches of programs through the program farm.
+    """
+
+    def __init__(self, jobs, build_dir=BUILD_DIR, max_cycles=200):
+        self.jobs = max(1, jobs)
+        self.build_dir = build_dir
+        self.max_cycles = max_cycles
+        self.slots = queue.Queue()
+        for slot in range(self.jobs):
+            self.slots.put(os.path.join(build_dir, 'slot%d' % slot))
+        self.pool = ThreadPoolExecutor(max_workers=self.jobs)
+        self.simulated = 0
+        # Functional coverage of every batch run so far:
+        self.coverage = Coverage()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def run_batch(self, images):
+        """Simulate a batch of images in one slot, returning their final states"""
+        slot = self.slots.get()
+        try:
+            os.makedirs(slot, exist_ok=True)
+            programs = os.path.join(slot, 'programs.bin')
+            results = os.path.join(slot, 'results.jsonl')
+            farm.write_images(images, programs)
+            coverage = os.path.join(slot, 'coverage.bin')
+            farm.launch(programs, results, slot, self.max_cycles, coverage=coverage)
+            if os.path.exists(coverage):
+                with self.lock:
+                    self.coverage.merge(Coverage.load(coverage))
+            states = list(farm.read_results(results)) if os.path.exists(results) else []
+            if len(states) != len(images):
+                raise RuntimeError('Simulated %d of %d programs, see %s'
+                                   % (len(states), len(images), os.path.join(slot, 'sim.log')))
+            return states
+        finally:
+            self.slots.put(slot)
+
+    def check(self, images, batch_size=None):
+        """Run images through the RTL and the model, returning each Failure"""
+        images = list(images)
+        if batch_size is None:
+            # Spread a small list over every slot:
+            batch_size = max(1, -(-len(images) // self.jobs))
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        failures = []
+        for batch, states in zip(batches, self.pool.map(self.run_batch, batches)):
+            self.simulated += len(batch)
+            for image, want, got in zip(batch, expected(batch, self.max_cycles), states):
+                fields = mismatches(want, got)
+                if fields:
+                    failures.append(Failure(image, fields, want, got))
+        return failures
+
+
+def complexity(image):
+    return (sum(1 for byte in image if byte), sum(image))
+
+
+def candidates(image):
+    """Simpler variants of an image: zeroed runs of bytes, then cleared operands"""
+    size = RAM_SIZE // 2
+    while size:
+        for start in range(0, RAM_SIZE, size):
+            if any(image[start:start + size]):
+                yield image[:start] + bytes(size) + image[start + size:]
+        size //= 2
+    for address, byte in enumerate(image):
+        if byte & 0x0f and byte & 0xf0:
+            yield image[:address] + bytes([byte & 0xf0]) + image[address + 1:]
+
+
+def shrink(failure, simulators, log=None):
+    """
+    Greedily simplify a failing program while it still mismatches in at
+    least one of the same fields. Each round simulates every candidate at
+    once, and takes the first that still fails.
+    """
+    while True:
+        simpler = [c for c in candidates(failure.program)
+                   if complexity(c) < complexity(failure.program)]
+        if not simpler:
+            return failure
+        still_failing = {f.program: f for f in simulators.check(simpler)
+                         if set(f.fields) & set(failure.fields)}
+        for candidate in simpler:
+            if candidate in still_failing:
+                failure = still_failing[candidate]
+                if log:
+                    log('  shrunk to %s' % failure.program.hex())
+                break
+        else:
+            return failure
+
+
+def describe(failure):
+    lines = [listing(failure.program)]
+    for field in failure.fields:
+        lines.append('%s: expected %s, got %s' % (field, failure.expected[field],
+                                                  failure.actual[field]))
+    return '\n'.join(lines)
+
+
+def save(failure, path):
+    with open(path + '.bin', 'wb') as out:
+        out.write(failure.program)
+    with open(path + '.txt', 'w') as out:
+        out.write(describe(failure) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='simulators to run at once (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the run (default: the time)')
+    parser.add_argument('--programs', type=int, default=10000,
+                        help='programs to generate (default: %(default)s)')
+    parser.add_argument('--index', type=int, default=None,
+                        help='only run this program of the seed')
+    parser.add_argument('--image', default=None,
+                        help='only run this RAM image (.bin or .hex)')
+    parser.add_argument('--batch', type=int, default=500,
+                        help='programs per simulation (default: %(default)s)')
+    parser.add_argument('--max-cycles', type=int, default=200,
+                        help='cycles to run programs that never halt (default: %(default)s)')
+    parser.add_argument('--exclude', nargs='*', default=[], metavar='MNEMONIC',
+                        help='instructions not to generate, eg. to get past a known bug')
+    parser.add_argument('--no-shrink', action='store_true', help='report failures as found')
+    parser.add_argument('--build-dir', default=BUILD_DIR,
+                        help='where each simulator gets its sim_build (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    unknown = [m for m in args.exclude if m.upper() not in isa.OPCODES]
+    if unknown:
+        parser.error('no such instruction: %s' % ', '.join(unknown))
+    weights = {opcode: weight for opcode, weight in WEIGHTS.items()
+               if isa.MNEMONICS[opcode] not in [m.upper() for m in args.exclude]}
+    seed = args.seed if args.seed is not None else int(time.time())
+
+    if args.image:
+        image = bytes(read_image(args.image))
+        if len(image) != RAM_SIZE:
+            parser.error('%s is %d bytes, not %d' % (args.image, len(image), RAM_SIZE))
+        images, names = [image], [os.path.basename(args.image)]
+    elif args.index is not None:
+        images, names = [program(seed, args.index, weights)], ['%d:%d' % (seed, args.index)]
+    else:
+        images = [program(seed, index, weights) for index in range(args.programs)]
+        names = ['%d:%d' % (seed, index) for index in range(args.programs)]
+    print('Fuzzing %d programs, seed %d, %d simulators' % (len(images), seed, args.jobs))
+
+    simulators = Simulators(args.jobs, args.build_dir, args.max_cycles)
+    start = time.time()
+    try:
+        failures = simulators.check(images, min(args.batch, max(1, -(-len(images) // args.jobs))))
+        elapsed = time.time() - start
+        print('%d programs in %.1fs (%.0f/s), %d failed' % (
+            len(images), elapsed, len(images) / elapsed if elapsed else 0, len(failures)))
+        simulators.coverage.report(holes=False)
+        simulators.coverage.save(os.path.join(args.build_dir, 'coverage.bin'))
+        failure_dir = os.path.join(args.build_dir, 'failures')
+        os.makedirs(failure_dir, exist_ok=True)
+        name_of = dict(zip(images, names))
+        for failure in failures:
+            name = name_of[failure.program]
+            print('\nFAIL %s (%s): %s' % (name, failure.program.hex(), ', '.join(failure.fields)))
+            path = os.path.join(failure_dir, name.replace(':', '-'))
+            save(failure, path)
+            if not args.no_shrink:
+                failure = shrink(failure, simulators, log=print)
+                save(failure, path + '.min')
+            print(describe(failure))
+            print('Reproduce with: python -m lib.fuzz --image %s.bin'
+                  % (path + ('' if args.no_shrink else '.min')))
+    finally:
+        simulators.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
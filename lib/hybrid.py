@@ -0,0 +1,183 @@
+"""
+Hybrid simulation: fast-forward a program in an instruction level model,
+then hand its state to the sap RTL for a cycle accurate window.
+
+ISAModel runs one instruction per step in plain Python, keeping the same
+architectural state as lib.model (whose alu() it shares) and the same
+cycle count per instruction as controller.v, for a sap of any widths. Its state converts to and from a lib.checkpoint
+Checkpoint, which is how it is deposited into (and read back from) the
+RTL, at an instruction boundary.
+
+Between instructions the model's control word is 0: the last control
+word of an instruction is not restored, so that level sensitive loads
+(eg. AI with the IR driving the bus) do not fire as the state is
+deposited. Registers the RTL leaves undefined continue as 0 in the model.
+"""
+from collections import namedtuple
+
+from lib import isa
+from lib.checkpoint import Checkpoint, Checkpointer
+from lib.model import ADDRESS_WIDTH, alu, data_width_of
+
+# Clock cycles each instruction takes, fetch included:
+CYCLES = {opcode: len(isa.FETCH) + len(sequence) for opcode, sequence in isa.SEQUENCES.items()}
+CYCLES[isa.JC] = CYCLES[isa.JZ] = len(isa.FETCH) + 1
+
+# The controller's state on an undefined opcode, which it never leaves:
+STALL_STEP = len(isa.FETCH)
+STALL_CONTROL = isa.FETCH[-1]
+
+HybridResult = namedtuple('HybridResult', (
+    'model_cycles', # cycles fast-forwarded in the model before the window
+    'rtl_cycles',   # cycles run in the RTL
+    'state',        # Checkpoint at the end: from the model if resumed, else the RTL
+    'cycles',       # total cycles, up to halt if it halted
+    'halted',
+))
+
+
+class ISAModel(object):
+    """One SAP computer, run an instruction at a time"""
+
+    def __init__(self, image, address_width=ADDRESS_WIDTH, data_width=None):
+        self.address_width = address_width
+        self.data_width = data_width_of(address_width, data_width)
+        self.operand_bits = self.data_width - 4
+        self.address_mask = (1 << address_width) - 1
+        self.ram = [int(word) & ((1 << self.data_width) - 1) for word in image]
+        if len(self.ram) != 1 << address_width:
+            raise ValueError('RAM images must be %d words, got %d'
+                             % (1 << address_width, len(self.ram)))
+        self.pc = self.mar = self.opcode = self.operand = 0
+        self.a = self.b = self.out = self.alu = self.overflow = self.zero = 0
+        self.cycle = 0        # clock cycles run
+        self.instructions = 0 # instructions run
+        self.halted = False
+        self.stalled = False  # hit an undefined opcode
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, cycle=0, address_width=ADDRESS_WIDTH, data_width=None):
+        """Continue from a Checkpoint taken at an instruction boundary"""
+        halted = bool((checkpoint.control or 0) & isa.HALT)
+        if checkpoint.step != 0 and not halted:
+            raise ValueError('Checkpoint is at step %s, not between instructions'
+                             % checkpoint.step)
+        model = cls([0 if word is None else word for word in checkpoint.ram],
+                    address_width, data_width)
+        for name in ('pc', 'mar', 'opcode', 'operand', 'a', 'b', 'out', 'alu',
+                     'overflow', 'zero'):
+            setattr(model, name, getattr(checkpoint, name) or 0)
+        model.cycle = cycle
+        model.halted = halted
+        return model
+
+    def checkpoint(self):
+        """The model's state as a Checkpoint, to restore into the RTL"""
+        if self.halted:
+            step, control = 0, isa.HALT
+        elif self.stalled:
+            step, control = STALL_STEP, STALL_CONTROL
+        else:
+            step, control = 0, 0
+        return Checkpoint(pc=self.pc, pc_out=None, mar=self.mar, opcode=self.opcode,
+                          operand=self.operand, a=self.a, b=self.b, out=self.out,
+                          step=step, control=control, alu=self.alu,
+                          overflow=self.overflow, zero=self.zero, ram=tuple(self.ram))
+
+    def step(self):
+        """Fetch and execute one instruction, returning the cycles it took"""
+        if self.halted or self.stalled:
+            return 0
+        self.mar = self.pc
+        word = self.ram[self.mar]
+        self.opcode = word >> self.operand_bits
+        self.operand = word & ((1 << self.operand_bits) - 1)
+        self.pc = (self.pc + 1) & self.address_mask
+        # The MAR and PC load the operand's low address bits off the bus:
+        opcode, operand, address = self.opcode, self.operand, self.operand & self.address_mask
+        if opcode not in CYCLES:
+            self.stalled = True
+            self.cycle += STALL_STEP
+            return STALL_STEP
+        if opcode == isa.LDA:
+            self.mar = address
+            self.a = self.ram[address]
+        elif opcode in (isa.ADD, isa.SUB):
+            self.mar = address
+            self.b = self.ram[address]
+            result, overflow, zero = alu(self.a, self.b, opcode == isa.SUB, self.data_width)
+            self.alu, self.overflow, self.zero = int(result), int(overflow), int(zero)
+            self.a = self.alu
+        elif opcode == isa.STA:
+            self.mar = address
+            self.ram[address] = self.a
+        elif opcode == isa.LDI:
+            self.a = operand
+        elif opcode == isa.JMP:
+            self.pc = address
+        elif opcode == isa.JC and self.overflow or opcode == isa.JZ and self.zero:
+            self.pc = address
+        elif opcode == isa.OUT:
+            self.out = self.a
+        elif opcode == isa.HLT:
+            self.halted = True
+        self.instructions += 1
+        self.cycle += CYCLES[opcode]
+        return CYCLES[opcode]
+
+    def run(self, instructions=None, pc=None, max_cycles=None):
+        """
+        Run until halted or stalled, or until instructions have run in
+        total, the next instruction is at address pc, or max_cycles have
+        run (finishing the instruction that crosses it).
+        """
+        while not (self.halted or self.stalled):
+            if instructions is not None and self.instructions >= instructions:
+                break
+            if pc is not None and self.pc == pc:
+                break
+            if max_cycles is not None and self.cycle >= max_cycles:
+                break
+            self.step()
+        return self
+
+
+def run(dut, image, instructions=None, pc=None, window=100, resume=True, max_cycles=10000,
+        address_width=ADDRESS_WIDTH, data_width=None):
+    """
+    Fast-forward image in the ISAModel (see ISAModel.run for instructions
+    and pc), deposit its state into a sap DUT of the given widths, and run
+    the RTL for window cycles, then on to the end of the instruction. If
+    resume, the model takes over again from the RTL's state and runs to
+    halt or max_cycles. Returns a HybridResult.
+    """
+    # Imported here, so ISAModel can be used without cocotb:
+    from lib.cycle import wait, run_until_halt
+
+    model = ISAModel(image, address_width, data_width).run(instructions, pc, max_cycles)
+    model_cycles = model.cycle
+    checkpointer = Checkpointer(dut, address_width, data_width)
+    checkpointer.restore(model.checkpoint())
+    yield from wait()
+
+    halt, step = dut.ctl_halt, dut.control.step
+
+    def halted():
+        return halt.value.is_resolvable and halt.value.integer == 1
+
+    rtl_cycles = 0
+    if not halted():
+        rtl_cycles = yield from run_until_halt(dut, max_cycles=window, halt=halt)
+    if not halted() and not model.stalled and step.value.integer != 0:
+        # Finish the instruction, so the model can carry on from a boundary:
+        rtl_cycles += yield from run_until_halt(
+            dut, max_cycles=isa.STEPS, halt=halt,
+            until=lambda dut: step.value.is_resolvable and step.value.integer == 0)
+    state = checkpointer.capture()
+    cycles = model_cycles + rtl_cycles
+    if resume and not halted() and not model.stalled and state.step == 0:
+        model = ISAModel.from_checkpoint(state, cycles, address_width, data_width).run(
+            max_cycles=max_cycles)
+        return HybridResult(model_cycles, rtl_cycles, model.checkpoint(), model.cycle,
+                            model.halted)
+    return HybridResult(model_cycles, rtl_cycles, state, cycles, halted())
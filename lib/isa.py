@@ -0,0 +1,128 @@
+"""
+SAP-1 instruction set and control sequencer microcode.
+Mirrors the opcodes and control bits in controller/controller.v.
+"""
+
+# Instruction opcodes:
+NOP = 0b0000
+LDA = 0b0001
+ADD = 0b0010
+SUB = 0b0011
+STA = 0b0100
+LDI = 0b0101
+JMP = 0b0110
+JC = 0b0111
+JZ = 0b1000
+OUT = 0b1110
+HLT = 0b1111
+
+OPCODES = {
+    'NOP': NOP, 'LDA': LDA, 'ADD': ADD, 'SUB': SUB, 'STA': STA, 'LDI': LDI,
+    'JMP': JMP, 'JC': JC, 'JZ': JZ, 'OUT': OUT, 'HLT': HLT,
+}
+MNEMONICS = {opcode: name for name, opcode in OPCODES.items()}
+
+# Control bits, with the same index as controller.v's control_bits:
+HALT = 1 << 15 # HLT - Halt
+MI = 1 << 14   # MAR In
+RI = 1 << 13   # RAM In
+RO = 1 << 12   # RAM Out
+IO = 1 << 11   # Instruction Out
+II = 1 << 10   # Instruction In
+AI = 1 << 9    # A Register In
+AO = 1 << 8    # A Register Out
+EO = 1 << 7    # Sum Out (ΣO)
+SU = 1 << 6    # Subtract
+BI = 1 << 5    # Register B In
+OI = 1 << 4    # Output Register In
+CI = 1 << 3    # Counter Increment
+CO = 1 << 2    # Counter Out
+J = 1 << 1     # Jump
+FI = 1 << 0    # Flags In
+
+# (control bit, short name, controller output port), from bit 15 down to 0:
+CONTROL_SIGNALS = (
+    (HALT, 'HLT', 'o_halt'),
+    (MI, 'MI', 'o_memory_address_in'),
+    (RI, 'RI', 'o_ram_in'),
+    (RO, 'RO', 'o_ram_out'),
+    (IO, 'IO', 'o_instruction_out'),
+    (II, 'II', 'o_instruction_in'),
+    (AI, 'AI', 'o_register_a_in'),
+    (AO, 'AO', 'o_register_a_out'),
+    (EO, 'EO', 'o_alu_out'),
+    (SU, 'SU', 'o_alu_subtract'),
+    (BI, 'BI', 'o_register_b_in'),
+    (OI, 'OI', 'o_register_output_in'),
+    (CI, 'CI', 'o_program_counter_increment'),
+    (CO, 'CO', 'o_program_counter_out'),
+    (J, 'J', 'o_program_counter_jump'),
+    (FI, 'FI', 'o_register_flags_in'),
+)
+
+
+def control_names(control):
+    """Name the control signals set in a control word, e.g. 'MI|CO'"""
+    names = [name for bit, name, port in CONTROL_SIGNALS if control & bit]
+    return '|'.join(names) or '-'
+
+
+# Control bits that put a value on the bus:
+BUS_DRIVERS = CO | RO | IO | AO | EO
+
+STEPS = 8 # o_step is 3 bits wide
+
+# Control sequence for each instruction, one control word per t-state.
+# Step 0,1 are the fetch cycle common to all instructions:
+FETCH = (MI | CO, RO | II | CI)
+SEQUENCES = {
+    NOP: (0,),
+    LDA: (MI | IO, RO | AI),
+    ADD: (MI | IO, RO | BI, AI | EO | FI),
+    SUB: (MI | IO, RO | BI, AI | EO | SU | FI),
+    STA: (MI | IO, RI | AO),
+    LDI: (IO | AI,),
+    JMP: (IO | J,),
+    OUT: (AO | OI,),
+    HLT: (HALT,),
+}
+
+
+def microcode(opcode, step, carry=0, zero=0):
+    """
+    Return (control_word, next_step) that the controller latches on the
+    clock edge that begins the given step, or None if controller.v has no
+    case for it. In that case control_bits and step are left as they are,
+    and the controller stalls.
+    """
+    if step < len(FETCH):
+        return FETCH[step], step + 1
+    if opcode == NOP:
+        # controller.v's NOP branch has no case (step): at any step after
+        # the fetch it clears the control word and starts the next fetch.
+        return 0, 0
+    if opcode in (JC, JZ):
+        if step != 2:
+            return None
+        # Jump on flag, else NOP:
+        flag = carry if opcode == JC else zero
+        return (IO | J) if flag else 0, 0
+    sequence = SEQUENCES.get(opcode)
+    if sequence is None or step - 2 >= len(sequence):
+        return None
+    next_step = step + 1 if step - 2 < len(sequence) - 1 else 0
+    return sequence[step - 2], next_step
+
+
+def microcode_index(opcode, step, carry=0, zero=0):
+    """Index into MICROCODE for the given controller inputs"""
+    return (((opcode << 3) | step) << 2) | (carry << 1) | zero
+
+
+# Precomputed (opcode, step, carry, zero) -> (control_word, next_step) table,
+# indexed by microcode_index():
+MICROCODE = tuple(microcode(opcode, step, carry, zero)
+                  for opcode in range(16)
+                  for step in range(STEPS)
+                  for carry in (0, 1)
+                  for zero in (0, 1))
@@ -0,0 +1,177 @@
+"""
+Streaming parser for simulator DEBUG output.
+
+Turns the text written with debugging on (the 'DEBUG: Clock cycle' lines
+of lib.cycle at SAP_TRACE_VERBOSITY=2, and the i_debug $display lines of
+the Verilog units) into one CycleRecord per clock cycle. The log is read
+a line at a time, so memory use does not grow with the size of the log.
+
+An index of the byte offset of every STRIDE'th cycle can be saved next to
+the log (LOG.idx), so a range of cycles is found by seeking straight to
+it. A log holding several runs, where the cycle count starts over, is
+indexed as several segments, and a range is looked up in each of them.
+
+Usage: python -m lib.logparse LOG [FIRST [LAST]]
+"""
+import argparse
+import os
+import re
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+CycleRecord = namedtuple('CycleRecord', (
+    'cycle',          # clock cycle number, 0 for anything before the first
+    'offset',         # byte offset in the log where the cycle starts
+    'bus',            # bus values, in order; None for values with x/z bits
+    'ram_reads',      # (address, data) read onto the bus
+    'ram_writes',     # (address, data) written from the bus
+    'program_writes', # (address, data) written in program mode
+))
+
+_CLOCK = re.compile(br'DEBUG: Clock cycle : (\d+)')
+_EVENTS = (
+    ('bus', re.compile(br'DEBUG: Bus value now : ([01xzXZ]+)')),
+    ('ram_reads', re.compile(br'DEBUG: RAM read address: ([01xzXZ]+) data to bus: ([01xzXZ]+)')),
+    ('ram_writes', re.compile(br'DEBUG: RAM write address: ([01xzXZ]+) data: ([01xzXZ]+)')),
+    ('program_writes', re.compile(br'DEBUG: Program RAM address: ([01xzXZ]+) data: ([01xzXZ]+)')),
+)
+
+_INDEX_MAGIC = b'SAPLOGIX'
+_INDEX_HEADER = struct.Struct('<8sQI')
+INDEX_ENTRY = np.dtype([('cycle', '<u8'), ('offset', '<u8')])
+DEFAULT_STRIDE = 1024
+
+
+def binary(value):
+    """Parse a Verilog %b value, None if it has x or z bits"""
+    try:
+        return int(value, 2)
+    except ValueError:
+        return None
+
+
+def parse(log, offset=0):
+    """
+    Yield a CycleRecord for each clock cycle in a log opened in binary
+    mode, starting from byte offset.
+    """
+    log.seek(offset)
+    record = None
+    events = None
+    for line in log:
+        if b'DEBUG:' in line:
+            clock = _CLOCK.search(line)
+            if clock:
+                if record is not None:
+                    yield record._replace(**events)
+                record = CycleRecord(int(clock.group(1)), offset, None, None, None, None)
+                events = {name: [] for name, pattern in _EVENTS}
+            else:
+                for name, pattern in _EVENTS:
+                    match = pattern.search(line)
+                    if match:
+                        if record is None:
+                            record = CycleRecord(0, offset, None, None, None, None)
+                            events = {name: [] for name, pattern in _EVENTS}
+                        values = tuple(binary(group) for group in match.groups())
+                        events[name].append(values[0] if name == 'bus' else values)
+                        break
+        offset += len(line)
+    if record is not None:
+        yield record._replace(**events)
+
+
+def build_index(path, stride=DEFAULT_STRIDE):
+    """
+    Write PATH.idx, with the offset of the first cycle of each segment of
+    the log and of every stride'th cycle after it. Returns the entries.
+    """
+    # Anything before the first clock cycle is cycle 0:
+    entries = [(0, 0)]
+    previous = 0
+    offset = 0
+    with open(path, 'rb') as log:
+        for line in log:
+            if b'Clock cycle' in line:
+                clock = _CLOCK.search(line)
+                if clock:
+                    cycle = int(clock.group(1))
+                    if cycle <= previous or cycle % stride == 0:
+                        entries.append((cycle, offset))
+                    previous = cycle
+            offset += len(line)
+    entries = np.array(entries, dtype=INDEX_ENTRY)
+    with open(path + '.idx', 'wb') as index:
+        index.write(_INDEX_HEADER.pack(_INDEX_MAGIC, os.path.getsize(path), stride))
+        index.write(entries.tobytes())
+    return entries
+
+
+def load_index(path, stride=DEFAULT_STRIDE):
+    """Read PATH.idx, building it if it is missing or the log has changed since"""
+    try:
+        with open(path + '.idx', 'rb') as index:
+            magic, size, saved_stride = _INDEX_HEADER.unpack(index.read(_INDEX_HEADER.size))
+            if magic == _INDEX_MAGIC and size == os.path.getsize(path):
+                return np.frombuffer(index.read(), dtype=INDEX_ENTRY)
+    except (OSError, struct.error):
+        pass
+    return build_index(path, stride)
+
+
+def segments(entries):
+    """Split index entries wherever the cycle count starts over"""
+    cycles = entries['cycle'].astype(np.int64)
+    restarts = np.nonzero(cycles[1:] <= cycles[:-1])[0] + 1
+    return np.split(entries, restarts)
+
+
+def cycles(path, first, last=None, index=None):
+    """Yield the CycleRecords for cycles first to last, inclusive, using the index"""
+    if last is None:
+        last = first
+    if index is None:
+        index = load_index(path)
+    with open(path, 'rb') as log:
+        for segment in segments(index):
+            if not len(segment) or segment['cycle'][0] > last:
+                continue
+            start = np.searchsorted(segment['cycle'], first, side='right') - 1
+            if start < 0:
+                start = 0
+            previous = None
+            for record in parse(log, int(segment['offset'][start])):
+                if record.cycle > last or (previous is not None and record.cycle <= previous):
+                    break # Past the range, or into the next segment
+                previous = record.cycle
+                if record.cycle >= first:
+                    yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('log', help='simulator output with DEBUG lines')
+    parser.add_argument('first', type=int, nargs='?', help='first cycle to show')
+    parser.add_argument('last', type=int, nargs='?', help='last cycle to show')
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE,
+                        help='cycles between index entries (default: %(default)s)')
+    parser.add_argument('--reindex', action='store_true', help='rebuild LOG.idx')
+    args = parser.parse_args(argv)
+
+    index = build_index(args.log, args.stride) if args.reindex else load_index(args.log, args.stride)
+    if args.first is None:
+        print('%s: %d index entries in %d segments' % (args.log, len(index), len(segments(index))))
+        return 0
+    for record in cycles(args.log, args.first, args.last, index):
+        print('cycle %d @%d: bus %s, RAM reads %s, writes %s, program %s' % (
+            record.cycle, record.offset,
+            ' '.join('x' if v is None else format(v, '08b') for v in record.bus) or '-',
+            record.ram_reads or '-', record.ram_writes or '-', record.program_writes or '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Backdoor access to RAM contents through the simulator handle.
+Loading an image this way takes no simulation time, and needs no
+i_program_write pulse per byte.
+
+For RAMs too big to load a word at a time, write_memh() saves an image
+for ram_16x8.v to load with $readmemh, at the start of the simulation.
+"""
+import os
+
+
+def read_intel_hex(path):
+    """Read an Intel HEX file into a list of bytes, gaps filled with 0"""
+    data = {}
+    base = 0
+    with open(path) as hex_file:
+        for number, line in enumerate(hex_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith(':'):
+                raise ValueError('%s:%d: not an Intel HEX record' % (path, number))
+            record = bytes.fromhex(line[1:])
+            count, address, kind = record[0], record[1] << 8 | record[2], record[3]
+            if len(record) != count + 5 or sum(record) & 0xff:
+                raise ValueError('%s:%d: bad record length or checksum' % (path, number))
+            payload = record[4:4 + count]
+            if kind == 0x00:
+                for offset, byte in enumerate(payload):
+                    data[base + address + offset] = byte
+            elif kind == 0x01:
+                break
+            elif kind == 0x02:
+                base = (payload[0] << 8 | payload[1]) << 4
+            elif kind == 0x04:
+                base = (payload[0] << 8 | payload[1]) << 16
+    image = [0] * (max(data) + 1 if data else 0)
+    for address, byte in data.items():
+        image[address] = byte
+    return image
+
+
+def read_memh(path):
+    """Read a $readmemh file into a list of words, gaps filled with 0"""
+    data = {}
+    address = 0
+    with open(path) as memh:
+        for number, line in enumerate(memh, 1):
+            for word in line.split('//')[0].split():
+                try:
+                    if word.startswith('@'):
+                        address = int(word[1:], 16)
+                        continue
+                    data[address] = int(word, 16)
+                except ValueError:
+                    raise ValueError('%s:%d: not a hex word: %s' % (path, number, word))
+                address += 1
+    image = [0] * (max(data) + 1 if data else 0)
+    for address, word in data.items():
+        image[address] = word
+    return image
+
+
+def write_memh(source, path, width=8):
+    """Write an image as a $readmemh file, one word of width bits per line"""
+    digits = (width + 3) // 4
+    with open(path, 'w') as memh:
+        for word in read_image(source, width):
+            memh.write('%0*x\n' % (digits, word))
+
+
+def _words(data, width):
+    """Words of width bits from bytes, little endian if wider than a byte"""
+    size = (width + 7) // 8
+    if size == 1:
+        return list(data)
+    if len(data) % size:
+        raise ValueError('%d bytes are not a whole number of %d bit words' % (len(data), width))
+    return [int.from_bytes(bytes(data[i:i + size]), 'little') for i in range(0, len(data), size)]
+
+
+def read_image(source, width=8):
+    """
+    Return a RAM image as a list of ints of width bits. source may be a
+    sequence of ints, bytes, or the path of an Intel HEX (.hex/.ihex),
+    $readmemh (.mem/.memh) or raw binary file. Binary and Intel HEX files
+    hold words wider than a byte little endian.
+    """
+    if isinstance(source, str):
+        extension = os.path.splitext(source)[1].lower()
+        if extension in ('.hex', '.ihex'):
+            return _words(read_intel_hex(source), width)
+        if extension in ('.mem', '.memh'):
+            return [word & ((1 << width) - 1) for word in read_memh(source)]
+        with open(source, 'rb') as binary:
+            return _words(binary.read(), width)
+    return [int(word) & ((1 << width) - 1) for word in source]
+
+
+def load_ram(ram, source, offset=0, width=8):
+    """
+    Write a whole image into a RAM array handle (eg. dut.ram.ram) at once.
+    Every word is set immediately, without waiting on the simulator.
+    """
+    image = read_image(source, width)
+    if offset + len(image) > len(ram):
+        raise ValueError('Image of %d bytes does not fit in %d byte RAM at offset %d'
+                         % (len(image), len(ram), offset))
+    for address, byte in enumerate(image, offset):
+        ram[address].setimmediatevalue(byte)
+    return image
+
+
+def read_ram(ram):
+    """Read a RAM array handle back as a list of ints (None for x/z words)"""
+    words = []
+    for address in range(len(ram)):
+        value = ram[address].value
+        words.append(value.integer if value.is_resolvable else None)
+    return words
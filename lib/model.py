@@ -0,0 +1,214 @@
+"""
+Vectorized golden model of the whole SAP computer (sap.v).
+
+A batch of N RAM images runs in lockstep, one clock cycle at a time, with
+every register held in a NumPy array of length N. Each cycle the
+controller latches a control word from lib.isa.MICROCODE, exactly like
+controller.v does on the rising clock edge, and the datapath performs the
+register transfers that control word asks for, as sap.v wires them: the
+IR drives its operand zero extended, a jump loads the PC from the bus,
+and the PC counts on every clock cycle CI is high.
+
+The one difference is the reset state: registers A/B/OUT come out of
+reset holding z in sap.v (0 under Verilator), which the model cannot
+hold, and 0 here. They are undefined until loaded, and lib.scoreboard
+skips them until then.
+
+Like sap.v, the model takes the RAM's ADDRESS_WIDTH and DATA_WIDTH as
+parameters, data_width being address_width + 4 unless given: its state
+arrays are the smallest unsigned type that holds a word.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from lib import isa
+
+ADDRESS_WIDTH = 4
+DATA_WIDTH = ADDRESS_WIDTH + 4
+RAM_SIZE = 1 << ADDRESS_WIDTH
+
+# Register state recorded per cycle when tracing:
+TRACE_FIELDS = ('bus', 'control', 'step', 'pc', 'mar', 'ir',
+                'a', 'b', 'out', 'carry', 'zero')
+
+RunResult = namedtuple('RunResult', ('display', 'halt_cycles', 'trace'))
+
+# MICROCODE unpacked into flat arrays, so a whole batch can be looked up
+# with one fancy index:
+_STALL = np.array([m is None for m in isa.MICROCODE])
+_CONTROL = np.array([0 if m is None else m[0] for m in isa.MICROCODE],
+                    dtype=np.uint16)
+_NEXT_STEP = np.array([0 if m is None else m[1] for m in isa.MICROCODE],
+                      dtype=np.uint8)
+
+
+def data_width_of(address_width, data_width=None):
+    """data_width, or sap.v's default of address_width + 4 if None"""
+    return address_width + 4 if data_width is None else data_width
+
+
+def word_type(data_width=DATA_WIDTH):
+    """The smallest little endian unsigned NumPy dtype holding a word"""
+    for size in (1, 2, 4, 8):
+        if data_width <= 8 * size:
+            return np.dtype('<u%d' % size)
+    raise ValueError('%d bit words are too wide' % data_width)
+
+
+def image_size(address_width=ADDRESS_WIDTH, data_width=None):
+    """Bytes per RAM image, as a bytes object holds it"""
+    return (1 << address_width) * word_type(data_width_of(address_width, data_width)).itemsize
+
+
+def as_images(images, address_width=ADDRESS_WIDTH, data_width=None):
+    """
+    Convert a RAM image, or a sequence of them, to an (N, 2**address_width)
+    array of words, (N, 16) uint8 by default. Bytes objects hold the words
+    little endian.
+    """
+    dtype = word_type(data_width_of(address_width, data_width))
+    size = 1 << address_width
+    if isinstance(images, (bytes, bytearray, memoryview)):
+        images = np.frombuffer(images, dtype=dtype)
+    elif len(images) and isinstance(images[0], (bytes, bytearray, memoryview)):
+        images = np.array([np.frombuffer(i, dtype=dtype) for i in images])
+    images = np.array(images, dtype=dtype, ndmin=2)
+    if images.ndim != 2 or images.shape[1] != size:
+        raise ValueError('RAM images must be %d words each, got shape %s'
+                         % (size, images.shape))
+    return images
+
+
+def alu(a, b, subtract, width=DATA_WIDTH):
+    """
+    Vectorized alu.v: returns (result, overflow flag, zero flag) arrays for
+    arrays of width bit operands and subtract flags.
+    """
+    dtype = word_type(width)
+    a = np.asarray(a, dtype=dtype)
+    b = np.asarray(b, dtype=dtype)
+    subtract = np.asarray(subtract, dtype=bool)
+    result = (np.where(subtract, a - b, a + b) & ((1 << width) - 1)).astype(dtype)
+    # Two's complement overflow: the operands (b negated when subtracting)
+    # have the same sign, and the result has the other sign:
+    sign = width - 1
+    sign_a, sign_b, sign_r = a >> sign, b >> sign, result >> sign
+    overflow = np.where(subtract,
+                        (sign_a != sign_b) & (sign_r != sign_a),
+                        (sign_a == sign_b) & (sign_r != sign_a))
+    return result, overflow.astype(np.uint8), (result == 0).astype(np.uint8)
+
+
+class SAPModel(object):
+    """Architectural state of N SAP computers, stepped one clock at a time"""
+
+    def __init__(self, images, address_width=ADDRESS_WIDTH, data_width=None):
+        self.address_width = address_width
+        self.data_width = data_width_of(address_width, data_width)
+        self.ram = as_images(images, address_width, self.data_width).copy()
+        self.word = self.ram.dtype
+        # The IR's opcode is its top 4 bits, its operand the rest:
+        self.operand_bits = self.data_width - 4
+        self.address_mask = (1 << address_width) - 1
+        n = len(self.ram)
+        self.rows = np.arange(n)
+        self.cycle = 0
+        self.bus = np.zeros(n, dtype=self.word)
+        self.control = np.zeros(n, dtype=np.uint16)
+        self.step = np.zeros(n, dtype=np.uint8)
+        self.pc = np.zeros(n, dtype=self.word)
+        self.mar = np.zeros(n, dtype=self.word)
+        self.ir = np.zeros(n, dtype=self.word)
+        self.a = np.zeros(n, dtype=self.word)
+        self.b = np.zeros(n, dtype=self.word)
+        self.out = np.zeros(n, dtype=self.word)
+        self.alu = np.zeros(n, dtype=self.word)
+        self.carry = np.zeros(n, dtype=np.uint8)
+        self.zero = np.zeros(n, dtype=np.uint8)
+        self.halt_cycles = np.full(n, -1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ram)
+
+    @property
+    def halted(self):
+        return self.halt_cycles >= 0
+
+    def clock(self):
+        """Advance every machine by one clock cycle"""
+        self.cycle += 1
+        index = (((self.ir.astype(np.intp) >> self.operand_bits) << 3 | self.step) << 2
+                 | self.carry << 1 | self.zero)
+        # The controller ignores the clock once halted, and holds its
+        # outputs if it has no case for the current opcode and step:
+        hold = _STALL[index] | ((self.control & isa.HALT) != 0)
+        control = np.where(hold, self.control, _CONTROL[index])
+        self.step = np.where(hold, self.step, _NEXT_STEP[index])
+        self.control = control
+
+        def on(bits, signals=control):
+            return (signals & bits) != 0
+
+        # The ALU sends the sum of A and B as the cycle began, and latches
+        # its flags:
+        compute = on(isa.EO)
+        if compute.any():
+            result, overflow, zero = alu(self.a, self.b, on(isa.SU), self.data_width)
+            self.alu = np.where(compute, result, self.alu)
+            self.carry = np.where(compute, overflow, self.carry)
+            self.zero = np.where(compute, zero, self.zero)
+
+        # Whichever unit is enabled drives the bus:
+        bus = np.zeros(len(self), dtype=self.word)
+        bus = np.where(on(isa.CO), self.pc, bus)
+        bus = np.where(on(isa.RO), self.ram[self.rows, self.mar], bus)
+        bus = np.where(on(isa.IO), self.ir & ((1 << self.operand_bits) - 1), bus)
+        bus = np.where(on(isa.AO), self.a, bus)
+        bus = np.where(on(isa.EO), self.alu, bus)
+        self.bus = bus
+
+        # Units reading from the bus:
+        self.mar = np.where(on(isa.MI), bus & self.address_mask, self.mar)
+        self.ir = np.where(on(isa.II), bus, self.ir)
+        self.a = np.where(on(isa.AI), bus, self.a)
+        self.b = np.where(on(isa.BI), bus, self.b)
+        self.out = np.where(on(isa.OI), bus, self.out)
+        write = on(isa.RI)
+        if write.any():
+            self.ram[self.rows[write], self.mar[write]] = bus[write]
+        # The PC loads a jump address, or counts, on the falling edge:
+        self.pc = np.where(on(isa.J), bus & self.address_mask,
+                           np.where(on(isa.CI), (self.pc + 1) & self.address_mask,
+                                    self.pc)).astype(self.word)
+
+        newly_halted = on(isa.HALT) & ~self.halted
+        self.halt_cycles[newly_halted] = self.cycle
+
+    def snapshot(self, fields=TRACE_FIELDS):
+        """Copy the given state arrays into a dict"""
+        return {name: getattr(self, name).copy() for name in fields}
+
+
+def run(images, max_cycles=1000, trace=False, address_width=ADDRESS_WIDTH, data_width=None):
+    """
+    Run a batch of RAM images from reset until every machine has halted,
+    or max_cycles have elapsed, on a sap of the given widths.
+
+    Returns a RunResult of:
+      display     - final o_display value for each image
+      halt_cycles - the clock cycle each image halted on (-1 if it didn't)
+      trace       - if trace is True, a dict of TRACE_FIELDS arrays, each
+                    of shape (cycles, N), holding the state after each cycle
+    """
+    model = SAPModel(images, address_width, data_width)
+    samples = {name: [] for name in TRACE_FIELDS} if trace else None
+    while model.cycle < max_cycles and not model.halted.all():
+        model.clock()
+        if trace:
+            for name in TRACE_FIELDS:
+                samples[name].append(getattr(model, name).copy())
+    if trace:
+        samples = {name: np.array(values).reshape(-1, len(model))
+                   for name, values in samples.items()}
+    return RunResult(model.out.copy(), model.halt_cycles.copy(), samples)
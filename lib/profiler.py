@@ -0,0 +1,123 @@
+"""
+Opt-in profiling of testbench coroutines.
+
+Every trigger yielded through lib.cycle is counted, and the wall time
+around it is split in two: Python time, from the last resume up to the
+yield, and simulator time, from the yield until the coroutine resumes.
+Both are charged to the stack of test helpers that made the yield, eg.
+controller_test;assert_fetch_cycle;clock;cycle;wait.
+
+Enable it by setting SAP_PROFILE to an output prefix (or 1, for
+'profile'). When the simulation exits it writes:
+  PREFIX.txt    - a flat table of yields, Python and simulator time for
+                  each function, including everything it called
+  PREFIX.folded - collapsed stacks for flamegraph.pl and similar tools,
+                  weighted by microseconds
+"""
+import atexit
+import os
+import sys
+import time
+
+_setting = os.environ.get('SAP_PROFILE', '')
+enabled = bool(_setting)
+prefix = 'profile' if _setting in ('', '1') else _setting
+
+# stack tuple -> [yields, python seconds, simulator seconds]
+samples = {}
+_resumed = None
+
+# Test decorators (eg. bench.measure) are not helpers:
+_TRANSPARENT = ('wrapper',)
+_LIB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def enable(output_prefix=None):
+    """Turn profiling on from a testbench, rather than the environment"""
+    global enabled, prefix
+    enabled = True
+    if output_prefix:
+        prefix = output_prefix
+
+
+def _stack(frame):
+    """Names of the testbench functions on the stack, outermost first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        if 'cocotb' in filename.split(os.sep) and not filename.startswith(_LIB_DIR):
+            break # Reached the scheduler
+        if code.co_name not in _TRANSPARENT:
+            names.append(code.co_name)
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+def timed(trigger):
+    """
+    Yield trigger from the calling coroutine, charging its Python and
+    simulator time to the caller's stack. Use as `yield from timed(t)`.
+    """
+    global _resumed
+    yielded = time.perf_counter()
+    stack = _stack(sys._getframe(1))
+    result = yield trigger
+    resumed = time.perf_counter()
+    sample = samples.get(stack)
+    if sample is None:
+        sample = samples[stack] = [0, 0.0, 0.0]
+    sample[0] += 1
+    sample[1] += yielded - _resumed if _resumed is not None else 0.0
+    sample[2] += resumed - yielded
+    _resumed = resumed
+    return result
+
+
+def flat_profile():
+    """Return {function: [yields, python seconds, simulator seconds]}, inclusive"""
+    totals = {}
+    for stack, (yields, python, simulator) in samples.items():
+        for name in set(stack):
+            total = totals.setdefault(name, [0, 0.0, 0.0])
+            total[0] += yields
+            total[1] += python
+            total[2] += simulator
+    return totals
+
+
+def write_flat(path):
+    totals = flat_profile()
+    width = max([len(name) for name in totals] + [8])
+    with open(path, 'w') as out:
+        out.write('%-*s %10s %12s %12s %8s\n' % (width, 'function', 'yields',
+                                                 'python s', 'simulator s', 'python%'))
+        for name, (yields, python, simulator) in sorted(
+                totals.items(), key=lambda item: -(item[1][1] + item[1][2])):
+            share = 100.0 * python / (python + simulator) if python + simulator else 0.0
+            out.write('%-*s %10d %12.6f %12.6f %7.1f%%\n' % (width, name, yields, python,
+                                                            simulator, share))
+
+
+def write_folded(path):
+    """Collapsed stacks, with python/simulator as the leaf frame"""
+    with open(path, 'w') as out:
+        for stack, (yields, python, simulator) in sorted(samples.items()):
+            frames = ';'.join(stack)
+            for leaf, seconds in (('[python]', python), ('[simulator]', simulator)):
+                microseconds = int(seconds * 1e6)
+                if microseconds:
+                    out.write('%s;%s %d\n' % (frames, leaf, microseconds))
+
+
+def write(output_prefix=None):
+    """Write PREFIX.txt and PREFIX.folded"""
+    output_prefix = output_prefix or prefix
+    write_flat(output_prefix + '.txt')
+    write_folded(output_prefix + '.folded')
+
+
+@atexit.register
+def _write_at_exit():
+    if enabled and samples:
+        write()
@@ -0,0 +1,148 @@
+"""
+Per-instruction cycle profile of programs running on the sap RTL.
+
+A ProgramProfiler samples the controller step, the IR's opcode and the
+program counter after every falling clock edge. An instruction starts
+on the cycle its fetch begins (step goes to 1), at the address the PC
+held then, and it is charged every cycle until the next fetch begins.
+Its opcode is read from the IR once it has been fetched.
+
+controller.v returns to step 0 straight after the last step of every
+instruction, so the only idle T-states are stalls: cycles where the
+controller holds its step and control word, as it does forever on an
+undefined opcode. These are counted separately, as well as in the
+instruction's cycles.
+
+The report is a flat table per address and opcode, totals per opcode,
+and a heatmap of cycles over the RAM addresses: 16 of them, unless the
+sap is built with a wider ADDRESS_WIDTH and the profiler told so.
+"""
+import sys
+
+import numpy as np
+
+from lib import isa
+from lib.model import ADDRESS_WIDTH
+from lib.util import handle
+
+OPCODES = 16
+SHADES = ' .:-=+*#%@' # Heatmap shades, from no cycles to the most
+
+
+class ProgramProfiler(object):
+    """Instructions, cycles and idle cycles per (address, opcode) of one DUT"""
+
+    SIGNALS = ('control.step', 'control.control_bits', 'ir.hiNib', 'pc.count')
+
+    def __init__(self, dut, address_width=ADDRESS_WIDTH):
+        self.dut = dut
+        self.address_width = address_width
+        self.handles = tuple(handle(dut, path) for path in self.SIGNALS)
+        size = 1 << address_width
+        self.instructions = np.zeros((size, OPCODES), dtype=np.uint64)
+        self.cycles = np.zeros((size, OPCODES), dtype=np.uint64)
+        self.idle = np.zeros((size, OPCODES), dtype=np.uint64)
+        self.current = None # [address, cycles, idle cycles] of the running instruction
+        self.previous = None
+        self.opcode = 0
+        self.running = False
+
+    def sample(self):
+        """Account for the clock cycle that just ran"""
+        values = []
+        for signal in self.handles:
+            value = signal.value
+            if not value.is_resolvable:
+                return
+            values.append(value.integer)
+        step, control, opcode, pc = values
+        if control & isa.HALT:
+            if self.current is not None:
+                # The HLT instruction's last cycle:
+                self.current[1] += 1
+                self.opcode = opcode
+            self.finish()
+            return
+        state = (step, control)
+        if step == 1 and control == isa.FETCH[0]:
+            self.finish()
+            self.current = [pc, 1, 0]
+        elif self.current is not None:
+            self.current[1] += 1
+            if state == self.previous:
+                self.current[2] += 1
+            if step > 1:
+                self.opcode = opcode # Fetched
+        self.previous = state
+
+    def finish(self):
+        """Charge the running instruction to its address and opcode"""
+        if self.current is not None:
+            address, cycles, idle = self.current
+            self.instructions[address, self.opcode] += 1
+            self.cycles[address, self.opcode] += cycles
+            self.idle[address, self.opcode] += idle
+            self.current = None
+
+    def monitor(self):
+        # Imported here, so profiles can be reported without cocotb:
+        from cocotb.triggers import FallingEdge, ReadOnly
+        clock = self.dut.i_clock
+        while self.running:
+            yield FallingEdge(clock)
+            yield ReadOnly()
+            if self.running:
+                self.sample()
+
+    def start(self):
+        """Fork the monitor, sampling until stop()"""
+        import cocotb
+        self.running = True
+        return cocotb.fork(cocotb.coroutine(self.monitor)())
+
+    def stop(self):
+        self.running = False
+        self.finish()
+
+    def report(self, out=sys.stdout):
+        """Write the flat table, opcode totals and heatmap"""
+        total = int(self.cycles.sum())
+        out.write('%-7s %-6s %12s %12s %8s %10s %7s\n' % (
+            'address', 'opcode', 'instructions', 'cycles', 'cyc/ins', 'idle', 'cycles%'))
+        for address, opcode in zip(*np.nonzero(self.instructions)):
+            instructions = int(self.instructions[address, opcode])
+            cycles = int(self.cycles[address, opcode])
+            out.write('%-7x %-6s %12d %12d %8.2f %10d %6.1f%%\n' % (
+                address, name(opcode), instructions, cycles, cycles / instructions,
+                int(self.idle[address, opcode]), 100.0 * cycles / total if total else 0))
+        out.write('\n%-6s %12s %12s %10s %7s\n' % ('opcode', 'instructions', 'cycles',
+                                                   'idle', 'cycles%'))
+        per_opcode = self.cycles.sum(axis=0)
+        for opcode in np.nonzero(self.instructions.sum(axis=0))[0]:
+            out.write('%-6s %12d %12d %10d %6.1f%%\n' % (
+                name(opcode), int(self.instructions[:, opcode].sum()),
+                int(per_opcode[opcode]), int(self.idle[:, opcode].sum()),
+                100.0 * per_opcode[opcode] / total if total else 0))
+        out.write('\n%s\n' % self.heatmap())
+
+    def heatmap(self, columns=4):
+        """Cycles per RAM address, as a grid of shades with the cycle share"""
+        per_address = self.cycles.sum(axis=1)
+        total = per_address.sum()
+        peak = per_address.max()
+        size = len(per_address)
+        digits = (self.address_width + 3) // 4
+        lines = ['Cycles by address (%d in total):' % total]
+        for row in range(0, size, columns):
+            cells = []
+            for address in range(row, min(row + columns, size)):
+                cycles = per_address[address]
+                shade = SHADES[int(round((len(SHADES) - 1) * cycles / peak))] if peak else ' '
+                cells.append('%0*x %s %5.1f%%' % (digits, address, shade * 3,
+                                                  100.0 * cycles / total if total else 0))
+            lines.append('  '.join(cells))
+        return '\n'.join(lines)
+
+
+def name(opcode):
+    return isa.MNEMONICS.get(int(opcode), format(int(opcode), '04b'))
@@ -0,0 +1,175 @@
+"""
+Parallel regression runner for every unit and integration testbench.
+
+Finds each directory whose Makefile includes lib/UnitMakefile, runs their
+simulations concurrently, each in its own sim_build directory, and merges
+the cocotb results into one report.
+
+Usage: python -m lib.regression [-j JOBS] [--sim SIMULATOR] [--xml FILE] [UNIT ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SAP_HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGRESSION_DIR = os.path.join(SAP_HOME, 'regression_build')
+
+# Directories that never hold testbenches (bench/ is run by lib.bench):
+SKIP_DIRS = ('.git', 'cocotb', 'lib', 'sim_build', 'regression_build', 'bench',
+             'farm_build', 'fuzz_build')
+
+Unit = namedtuple('Unit', ('name', 'path'))
+UnitResult = namedtuple('UnitResult', ('unit', 'returncode', 'wall_time',
+                                       'testcases', 'failures', 'log', 'cache'))
+
+
+def find_units(root=SAP_HOME):
+    """Find every testbench directory below root, sorted by name"""
+    units = []
+    for path, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        if 'Makefile' not in files:
+            continue
+        with open(os.path.join(path, 'Makefile')) as makefile:
+            lines = makefile.read().splitlines()
+        if not any('UnitMakefile' in line for line in lines):
+            continue
+        name = os.path.relpath(path, root)
+        if name == '.':
+            # The top level Makefile names its DUT:
+            duts = [l.split('=', 1)[1].strip() for l in lines if l.startswith('DUT=')]
+            name = duts[0] if duts else os.path.basename(os.path.abspath(root))
+        units.append(Unit(name, path))
+    return sorted(units)
+
+
+def read_testcases(results_file):
+    """Return the <testcase> elements from a cocotb results file"""
+    if not os.path.exists(results_file):
+        return []
+    try:
+        return ET.parse(results_file).getroot().iter('testcase')
+    except ET.ParseError:
+        return []
+
+
+def is_failure(testcase):
+    return (testcase.find('failure') is not None or
+            testcase.find('error') is not None)
+
+
+def read_cache_event(log):
+    """Find whether lib.simcache had the unit's compiled simulation"""
+    with open(log) as output:
+        for line in output:
+            if line.startswith('SIM CACHE: hit') or line.startswith('SIM CACHE: miss'):
+                return line.split()[2]
+    return '-'
+
+
+def run_unit(unit, build_dir=REGRESSION_DIR, make_args=()):
+    """Run one unit's simulation in an isolated build directory"""
+    unit_dir = os.path.join(build_dir, unit.name)
+    os.makedirs(unit_dir, exist_ok=True)
+    results_file = os.path.join(unit_dir, 'results.xml')
+    if os.path.exists(results_file):
+        os.remove(results_file)
+    log = os.path.join(unit_dir, 'sim.log')
+    # The Makefiles find SAP_HOME relative to $(PWD), so run from the unit:
+    env = dict(os.environ, PWD=unit.path, COCOTB_RESULTS_FILE=results_file)
+    command = ['make', 'sim',
+               'SIM_BUILD=%s' % os.path.join(unit_dir, 'sim_build')]
+    command.extend(make_args)
+    start = time.time()
+    with open(log, 'w') as output:
+        returncode = subprocess.call(command, cwd=unit.path, stdout=output,
+                                     stderr=subprocess.STDOUT, env=env)
+    wall_time = time.time() - start
+    # Older cocotb always writes results.xml next to the Makefile:
+    if not os.path.exists(results_file):
+        fallback = os.path.join(unit.path, 'results.xml')
+        if os.path.exists(fallback):
+            os.replace(fallback, results_file)
+    testcases = list(read_testcases(results_file))
+    failures = sum(1 for t in testcases if is_failure(t))
+    if returncode != 0 and not failures:
+        # The build or simulator failed before any test could report:
+        failures = 1
+    return UnitResult(unit, returncode, wall_time, testcases, failures, log,
+                      read_cache_event(log))
+
+
+def write_report(results, path):
+    """Merge every unit's testcases into one JUnit XML file"""
+    root = ET.Element('testsuites')
+    for result in results:
+        suite = ET.SubElement(root, 'testsuite', {
+            'name': result.unit.name,
+            'tests': str(len(result.testcases)),
+            'failures': str(result.failures),
+            'time': '%.3f' % result.wall_time,
+        })
+        for testcase in result.testcases:
+            suite.append(testcase)
+        if result.returncode != 0 and not result.testcases:
+            testcase = ET.SubElement(suite, 'testcase', {
+                'classname': result.unit.name, 'name': 'build'})
+            ET.SubElement(testcase, 'error', {
+                'message': 'make exited with status %d, see %s'
+                           % (result.returncode, result.log)})
+    ET.ElementTree(root).write(path)
+
+
+def print_summary(results, wall_time, out=sys.stdout):
+    width = max([len(r.unit.name) for r in results] + [4])
+    out.write('%-*s %6s %8s %9s %6s  %s\n' % (width, 'unit', 'tests', 'failures',
+                                             'time (s)', 'cache', 'status'))
+    for r in results:
+        status = 'FAIL (%s)' % r.log if r.failures else 'ok'
+        out.write('%-*s %6d %8d %9.2f %6s  %s\n' % (width, r.unit.name, len(r.testcases),
+                                                   r.failures, r.wall_time, r.cache, status))
+    out.write('%d units, %d failed, %.2fs wall time (%.2fs if run serially)\n' % (
+        len(results), sum(1 for r in results if r.failures), wall_time,
+        sum(r.wall_time for r in results)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('units', nargs='*',
+                        help='only run these units (default: all of them)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='simulations to run at once (default: %(default)s)')
+    parser.add_argument('--build-dir', default=REGRESSION_DIR,
+                        help='where each unit gets its sim_build and logs')
+    parser.add_argument('--xml', default=None,
+                        help='merged results file (default: BUILD_DIR/results.xml)')
+    parser.add_argument('--sim', default=None,
+                        help="simulator backend for every unit (default: each unit's own)")
+    args = parser.parse_args(argv)
+
+    units = find_units()
+    if args.units:
+        units = [u for u in units if u.name in args.units]
+        missing = set(args.units) - set(u.name for u in units)
+        if missing:
+            parser.error('no such unit: %s' % ', '.join(sorted(missing)))
+
+    start = time.time()
+    # Each simulation is its own make/vvp process; the pool just waits on them:
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        make_args = ['SIM=%s' % args.sim] if args.sim else []
+        results = list(pool.map(lambda u: run_unit(u, args.build_dir, make_args), units))
+    wall_time = time.time() - start
+
+    write_report(results, args.xml or os.path.join(args.build_dir, 'results.xml'))
+    print_summary(results, wall_time)
+    return 1 if any(r.failures for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
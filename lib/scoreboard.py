@@ -0,0 +1,133 @@
+"""
+Lockstep scoreboard: steps the golden model (lib.model) alongside a
+running sap DUT, and compares the two every clock cycle.
+
+The DUT's ADDRESS_WIDTH and DATA_WIDTH default to lib.model's: pass a
+wider sap's to Scoreboard.
+"""
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+from lib import isa
+from lib.model import ADDRESS_WIDTH, SAPModel, data_width_of
+from lib.util import handle
+
+
+def signals(address_width=ADDRESS_WIDTH, data_width=None):
+    """(model field, bit width, DUT signal path) for the architectural state"""
+    data_width = data_width_of(address_width, data_width)
+    return (
+        ('bus', data_width, 'bus'),
+        ('control', 16, 'control.control_bits'),
+        ('step', 3, 'control.step'),
+        ('pc', address_width, 'pc.count'),
+        ('mar', address_width, 'mar.address'),
+        ('ir', data_width, ('ir.hiNib', 'ir.loNib')),
+        ('a', data_width, 'register_A.data'),
+        ('b', data_width, 'register_B.data'),
+        ('out', data_width, 'register_OUT.data'),
+        ('carry', 1, 'alu.overflow_flag'),
+        ('zero', 1, 'alu.zero_flag'),
+    )
+
+
+SIGNALS = signals()
+
+# Registers that come out of reset undefined, until something loads them:
+LOADED_BY = {'a': isa.AI, 'b': isa.BI, 'out': isa.OI}
+
+
+class Scoreboard(object):
+    """
+    Passive monitor of a sap DUT. Once started, it samples the DUT after
+    every clock cycle, steps the model one cycle, and fails on the first
+    difference between them.
+    """
+
+    def __init__(self, dut, address_width=ADDRESS_WIDTH, data_width=None):
+        self.dut = dut
+        self.address_width = address_width
+        self.data_width = data_width_of(address_width, data_width)
+        self.signals = signals(address_width, self.data_width)
+        self.handles = {}
+        for name, width, path in self.signals:
+            paths = path if isinstance(path, tuple) else (path,)
+            self.handles[name] = [handle(dut, p) for p in paths]
+        self.model = None
+        self.loaded = set()
+        self.mismatch = None
+
+    def read(self, name):
+        """Read a DUT signal as a binary string"""
+        return ''.join(h.value.binstr for h in self.handles[name])
+
+    def sync(self):
+        """Start a fresh model from the DUT's current state and RAM"""
+        ram = self.dut.ram.ram
+        self.model = SAPModel([[ram[i].value.integer for i in range(1 << self.address_width)]],
+                              self.address_width, self.data_width)
+        self.loaded = set()
+        for name, width, path in self.signals:
+            value = self.read(name)
+            if 'x' in value or 'z' in value:
+                continue
+            getattr(self.model, name)[0] = int(value, 2)
+            if name in LOADED_BY:
+                self.loaded.add(name)
+        self.model.cycle = 0
+
+    def compare(self):
+        """Return [(field, expected, actual), ...] for this cycle's differences"""
+        model = self.model
+        control = int(model.control[0])
+        for name, bits in LOADED_BY.items():
+            if control & bits:
+                self.loaded.add(name)
+        diffs = []
+        for name, width, path in self.signals:
+            if name in LOADED_BY and name not in self.loaded:
+                continue
+            expected = format(int(getattr(model, name)[0]), '0%db' % width)
+            actual = self.read(name)
+            if name == 'bus' and not control & isa.BUS_DRIVERS:
+                # Floating, with no unit driving it:
+                continue
+            if expected != actual:
+                diffs.append((name, expected, actual))
+        return diffs
+
+    def report(self, diffs):
+        """Format a compact diff of one cycle"""
+        model = self.model
+        lines = ['Scoreboard mismatch at cycle %d (step %d, opcode %s, control %s):'
+                 % (model.cycle, model.step[0],
+                    isa.MNEMONICS.get(int(model.ir[0]) >> model.operand_bits, '???'),
+                    isa.control_names(int(model.control[0])))]
+        lines.append('  %-8s %-18s %s' % ('signal', 'model', 'dut'))
+        for name, expected, actual in diffs:
+            lines.append('  %-8s %-18s %s' % (name, expected, actual))
+        return '\n'.join(lines)
+
+    @cocotb.coroutine
+    def monitor(self):
+        """Check every clock cycle until the first mismatch"""
+        if self.model is None:
+            self.sync()
+        while True:
+            yield FallingEdge(self.dut.i_clock)
+            yield ReadOnly()
+            self.model.clock()
+            diffs = self.compare()
+            if diffs:
+                self.mismatch = self.report(diffs)
+                raise AssertionError(self.mismatch)
+
+    def start(self):
+        """Sync with the DUT and fork the monitor"""
+        self.sync()
+        return cocotb.fork(self.monitor())
+
+    def check(self):
+        """Fail if the monitor has seen a mismatch"""
+        if self.mismatch is not None:
+            raise AssertionError(self.mismatch)
@@ -0,0 +1,220 @@
+"""
+Content-hashed cache of compiled simulations, shared between units.
+
+The key is a hash of the toplevel, the compile arguments, the simulator
+version, and the contents of every Verilog source plus everything it
+pulls in with `include. lib/UnitMakefile calls `fetch` before make decides
+whether to recompile, and `store` after a compile, so an unchanged design
+is never compiled twice. The least recently used entries are evicted once
+the cache grows past its size limit.
+
+Usage: python -m lib.simcache [options] fetch|store|stats|clear [SOURCE ...]
+"""
+import argparse
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'sap-sim')
+DEFAULT_MAX_SIZE = 512 # MB
+
+IMAGE = 'sim.vvp'   # The compiled simulation in SIM_BUILD
+KEY_FILE = 'sim.key' # Key of the image currently in SIM_BUILD
+EVENTS = 'events.log'
+
+INCLUDE = re.compile(r'^\s*`include\s+"([^"]+)"', re.MULTILINE)
+
+
+def include_closure(sources, include_dirs=()):
+    """
+    Return every file the sources depend on, in the order iverilog reads
+    them. An `include is looked up next to the file that includes it, then
+    in the current directory, then in each -I directory.
+    """
+    seen = []
+
+    def visit(path):
+        path = os.path.normpath(os.path.abspath(path))
+        if path in seen:
+            return
+        seen.append(path)
+        with open(path) as source:
+            text = source.read()
+        for name in INCLUDE.findall(text):
+            for directory in (os.path.dirname(path), os.getcwd()) + tuple(include_dirs):
+                candidate = os.path.join(directory, name)
+                if os.path.exists(candidate):
+                    visit(candidate)
+                    break
+
+    for source in sources:
+        visit(source)
+    return seen
+
+
+def simulator_version():
+    try:
+        output = subprocess.check_output(['iverilog', '-V'], stderr=subprocess.STDOUT,
+                                         universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return output.splitlines()[0] if output else ''
+
+
+def cache_key(sources, toplevel, args=''):
+    """Hash everything that determines the compiled simulation"""
+    arg_list = shlex.split(args)
+    include_dirs = [a[2:] for a in arg_list if a.startswith('-I')]
+    digest = hashlib.sha256()
+    for part in (simulator_version(), toplevel, ' '.join(arg_list)):
+        digest.update(part.encode() + b'\0')
+    for path in include_closure(sources, include_dirs):
+        digest.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as source:
+            digest.update(hashlib.sha256(source.read()).digest())
+    return digest.hexdigest()
+
+
+def log_event(cache, event, key, build_dir):
+    with open(os.path.join(cache, EVENTS), 'a') as events:
+        events.write('%d %s %s %s\n' % (time.time(), event, key, build_dir))
+
+
+def read_key(build_dir):
+    try:
+        with open(os.path.join(build_dir, KEY_FILE)) as key_file:
+            return key_file.read().strip()
+    except OSError:
+        return None
+
+
+def write_key(build_dir, key):
+    with open(os.path.join(build_dir, KEY_FILE), 'w') as key_file:
+        key_file.write(key + '\n')
+
+
+def fetch(cache, build_dir, key):
+    """
+    Make sure build_dir holds the image for key, or nothing at all.
+    Returns 'hit' or 'miss'.
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    image = os.path.join(build_dir, IMAGE)
+    entry = os.path.join(cache, key, IMAGE)
+    if read_key(build_dir) == key and os.path.exists(image):
+        event = 'hit'
+    elif os.path.exists(entry):
+        # Copied, not linked, so the image is newer than the sources and
+        # make does not rebuild it:
+        shutil.copyfile(entry, image)
+        write_key(build_dir, key)
+        event = 'hit'
+    else:
+        # A stale image may still be newer than the sources, eg. when
+        # only an `include changed, so make has to rebuild it:
+        for name in (IMAGE, KEY_FILE):
+            if os.path.exists(os.path.join(build_dir, name)):
+                os.remove(os.path.join(build_dir, name))
+        event = 'miss'
+    if os.path.isdir(os.path.dirname(entry)):
+        # Mark as recently used:
+        os.utime(os.path.dirname(entry))
+    log_event(cache, event, key, build_dir)
+    return event
+
+
+def store(cache, build_dir, key, max_size=DEFAULT_MAX_SIZE):
+    """Copy a freshly compiled image into the cache"""
+    entry = os.path.join(cache, key)
+    os.makedirs(entry, exist_ok=True)
+    # Copy then rename, so a parallel fetch never sees half an image:
+    temporary = os.path.join(entry, '%s.%d' % (IMAGE, os.getpid()))
+    shutil.copyfile(os.path.join(build_dir, IMAGE), temporary)
+    os.replace(temporary, os.path.join(entry, IMAGE))
+    write_key(build_dir, key)
+    log_event(cache, 'store', key, build_dir)
+    evict(cache, max_size)
+
+
+def entries(cache):
+    """Return [(last used, size in bytes, path), ...], oldest first"""
+    found = []
+    for name in os.listdir(cache):
+        path = os.path.join(cache, name)
+        if not os.path.isdir(path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        found.append((os.path.getmtime(path), size, path))
+    return sorted(found)
+
+
+def evict(cache, max_size=DEFAULT_MAX_SIZE):
+    """Remove least recently used entries until the cache fits in max_size MB"""
+    found = entries(cache)
+    total = sum(size for used, size, path in found)
+    limit = max_size * 1024 * 1024
+    # Always keep the newest entry, even if it is too big on its own:
+    for used, size, path in found[:-1]:
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def stats(cache, out=sys.stdout):
+    """Print hit/miss counts and the size of the cache"""
+    counts = {'hit': 0, 'miss': 0, 'store': 0}
+    if os.path.exists(os.path.join(cache, EVENTS)):
+        with open(os.path.join(cache, EVENTS)) as events:
+            for line in events:
+                fields = line.split()
+                if len(fields) > 1 and fields[1] in counts:
+                    counts[fields[1]] += 1
+    lookups = counts['hit'] + counts['miss']
+    found = entries(cache) if os.path.isdir(cache) else []
+    out.write('%s: %d entries, %.1f MB\n' % (
+        cache, len(found), sum(size for used, size, path in found) / 1024.0 / 1024.0))
+    out.write('%d hits, %d misses (%.0f%% hit rate), %d stores\n' % (
+        counts['hit'], counts['miss'], 100.0 * counts['hit'] / lookups if lookups else 0,
+        counts['store']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', choices=('fetch', 'store', 'stats', 'clear'))
+    parser.add_argument('sources', nargs='*', help='Verilog sources to compile')
+    parser.add_argument('--cache', default=os.environ.get('SIM_CACHE', DEFAULT_CACHE),
+                        help='shared cache directory (default: %(default)s)')
+    parser.add_argument('--build-dir', default='sim_build',
+                        help="the unit's SIM_BUILD directory")
+    parser.add_argument('--toplevel', default='')
+    parser.add_argument('--args', default='', help='compile arguments')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help='evict entries past this many MB (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        stats(args.cache)
+        return 0
+    if args.command == 'clear':
+        shutil.rmtree(args.cache, ignore_errors=True)
+        return 0
+
+    os.makedirs(args.cache, exist_ok=True)
+    key = cache_key(args.sources, args.toplevel, args.args)
+    if args.command == 'fetch':
+        event = fetch(args.cache, args.build_dir, key)
+    else:
+        store(args.cache, args.build_dir, key, args.max_size)
+        event = 'store'
+    print('SIM CACHE: %s %s (%s)' % (event, key[:12], args.toplevel))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
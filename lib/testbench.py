@@ -0,0 +1,202 @@
+"""
+Concurrent testbench components: drivers, monitors and checkers.
+
+A Driver is a forked coroutine that takes transactions off a queue and
+drives them onto the DUT's inputs, holding each for a number of time
+steps. A Monitor is woken by a value change of any of its signals, and
+samples them all once per time step, in the ReadOnly phase once every
+delta cycle has settled. Each Sample goes to the monitor's subscribers,
+eg. a Checker, which compares the outputs against a model of the unit
+fed with the same sample.
+
+Stimulus and checking run side by side: the driver never waits on a
+check, and every change of the outputs is checked, not only the points
+where a sequential testbench would stop and assert. A test queues its
+transactions, waits for the driver to drain, then calls check():
+
+    monitor = Monitor(dut, INPUTS + OUTPUTS)
+    checker = Checker(model)
+    monitor.subscribe(checker)
+    monitor.start()
+    driver = Driver(dut, INPUTS)
+    driver.extend(transactions)
+    driver.start()
+    yield from driver.drained()
+    monitor.stop()
+    checker.check()
+"""
+import collections
+
+from lib.util import handle
+
+# One time step's values of a monitor's signals, as binary strings:
+Sample = collections.namedtuple('Sample', ('time', 'values'))
+
+
+class Driver(object):
+    """Drives transactions, {signal: value} dicts, onto the DUT from a queue"""
+
+    def __init__(self, dut, signals, hold=1):
+        self.handles = collections.OrderedDict((name, handle(dut, name)) for name in signals)
+        self.hold = hold # time steps to hold each transaction for
+        self.queue = collections.deque()
+        self.driven = 0
+        self.running = False
+        self.idle = True
+        self._wake = self._drained = None
+
+    def append(self, transaction, hold=None):
+        """Queue one transaction, held for hold time steps (default: self.hold)"""
+        self.queue.append((transaction, hold or self.hold))
+        self.idle = False
+        if self._wake is not None:
+            self._wake.set()
+
+    def extend(self, transactions):
+        for transaction in transactions:
+            self.append(transaction)
+
+    def drive(self):
+        # Imported here, so transactions can be queued before the simulator starts:
+        from cocotb.triggers import Timer
+        handles = self.handles
+        while self.running:
+            if not self.queue:
+                self.idle = True
+                self._drained.set()
+                self._wake.clear()
+                yield self._wake.wait()
+                continue
+            transaction, hold = self.queue.popleft()
+            # Written together, in the same write phase:
+            for name, value in transaction.items():
+                handles[name] <= value
+            self.driven += 1
+            yield Timer(hold)
+
+    def start(self):
+        """Fork the driver, driving transactions as they are queued, until stop()"""
+        import cocotb
+        from cocotb.triggers import Event
+        self._wake, self._drained = Event(), Event()
+        self.running = True
+        return cocotb.fork(cocotb.coroutine(self.drive)())
+
+    def drained(self):
+        """Wait until every queued transaction has been driven and held"""
+        if not self.idle and not self.running:
+            # Nothing would ever drive the queue, or set the event:
+            raise RuntimeError('Driver is not running: start() it before waiting for it to drain')
+        while not self.idle:
+            self._drained.clear()
+            yield self._drained.wait()
+
+    def stop(self):
+        self.running = False
+        if self._wake is not None:
+            self._wake.set()
+
+
+class Monitor(object):
+    """Samples a group of signals at the end of every time step any of them changes in"""
+
+    def __init__(self, dut, signals):
+        self.names = tuple(signals)
+        self.handles = tuple(handle(dut, name) for name in self.names)
+        self.subscribers = []
+        self.samples = 0
+        self.running = False
+
+    def subscribe(self, callback):
+        """Call callback(sample) with every Sample"""
+        self.subscribers.append(callback)
+
+    def sample(self, time):
+        sample = Sample(time, dict(zip(self.names, [h.value.binstr for h in self.handles])))
+        self.samples += 1
+        for callback in self.subscribers:
+            callback(sample)
+
+    def monitor(self):
+        # Imported here, so subscribers can be tested without cocotb:
+        from cocotb.triggers import Edge, First, ReadOnly
+        from cocotb.utils import get_sim_time
+        yield ReadOnly()
+        self.sample(get_sim_time())
+        while self.running:
+            yield First(*[Edge(signal) for signal in self.handles])
+            # Every change made in this time step, sampled once:
+            yield ReadOnly()
+            if self.running:
+                self.sample(get_sim_time())
+
+    def start(self):
+        """Fork the monitor, sampling until stop()"""
+        import cocotb
+        self.running = True
+        return cocotb.fork(cocotb.coroutine(self.monitor)())
+
+    def stop(self):
+        self.running = False
+
+
+class Checker(object):
+    """
+    Compares every Sample with model(values), which returns the expected
+    binary string of each output it predicts, or None for don't care.
+    Mismatches are counted, and the first one is kept for check().
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.checked = 0
+        self.mismatches = 0
+        self.mismatch = None
+
+    def __call__(self, sample):
+        expected = self.model(sample.values)
+        self.checked += 1
+        diffs = [(name, value, sample.values[name]) for name, value in expected.items()
+                 if value is not None and sample.values[name] != value]
+        if diffs:
+            self.mismatches += 1
+            if self.mismatch is None:
+                self.mismatch = self.report(sample, diffs)
+
+    def report(self, sample, diffs):
+        """Format a compact diff of one sample"""
+        lines = ['Checker mismatch at time %d, inputs %s:' % (
+            sample.time, ' '.join('%s=%s' % (name, value)
+                                  for name, value in sorted(sample.values.items())
+                                  if name.startswith('i_')))]
+        lines.append('  %-14s %-18s %s' % ('signal', 'model', 'dut'))
+        for name, expected, actual in diffs:
+            lines.append('  %-14s %-18s %s' % (name, expected, actual))
+        return '\n'.join(lines)
+
+    def check(self):
+        """Fail with the first mismatch, if there was one"""
+        if self.mismatch is not None:
+            raise AssertionError('%s\n(%d of %d samples mismatched)'
+                                 % (self.mismatch, self.mismatches, self.checked))
+
+
+class Edges(object):
+    """Rising and falling edges, and changes, between a model's last two samples"""
+
+    def __init__(self):
+        self.last = self.values = None
+
+    def update(self, values):
+        """Take the next sample's values; False for the first, with nothing to compare"""
+        self.last, self.values = self.values, dict(values)
+        return self.last is not None
+
+    def rose(self, name):
+        return self.values[name] == '1' and self.last[name] != '1'
+
+    def fell(self, name):
+        return self.values[name] == '0' and self.last[name] != '0'
+
+    def changed(self, name):
+        return self.values[name] != self.last[name]
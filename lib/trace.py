@@ -0,0 +1,110 @@
+"""
+Per-DUT cycle trace recorder.
+
+Each DUT gets its own cycle counter and a fixed size ring buffer, allocated
+up front, holding the last N cycle numbers and any sampled signals. Nothing
+is printed or written while the simulation runs, unless the verbosity asks
+for it; the buffer is dumped to a file on failure or on request.
+
+Verbosity (SAP_TRACE_VERBOSITY in the environment, default 1):
+  0 - only count cycles
+  1 - count cycles and record samples in the ring buffer
+  2 - also print the old 'DEBUG: Clock cycle' lines every cycle
+"""
+import functools
+import os
+from array import array
+
+from cocotb.result import TestFailure, TestError
+
+from lib.util import handle
+
+DEFAULT_SIZE = 4096
+DEFAULT_VERBOSITY = int(os.environ.get('SAP_TRACE_VERBOSITY', 1))
+UNDEFINED = 0xffffffffffffffff # Stored for x/z samples
+
+_recorders = {}
+
+
+class TraceRecorder(object):
+    """Cycle counter and ring buffer of the last `size` cycles of one DUT"""
+
+    def __init__(self, dut, size=DEFAULT_SIZE, signals=(), verbosity=DEFAULT_VERBOSITY):
+        self.dut = dut
+        self.size = size
+        self.names = tuple(signals)
+        self.handles = tuple(handle(dut, name) for name in self.names)
+        self.verbosity = verbosity
+        self.count = 0    # Clock cycles run so far
+        self.recorded = 0 # Entries written to the ring buffer so far
+        self.cycles = array('Q', bytes(8 * size))
+        self.samples = array('Q', bytes(8 * size * len(self.handles)))
+
+    def record(self):
+        """Count a clock cycle, and sample the signals into the ring buffer"""
+        self.count += 1
+        if self.verbosity >= 2:
+            print("DEBUG: -------------------------------")
+            print("DEBUG: Clock cycle : %d" % self.count)
+        if self.verbosity < 1:
+            return
+        slot = self.recorded % self.size
+        self.cycles[slot] = self.count
+        width = len(self.handles)
+        for index, signal in enumerate(self.handles):
+            value = signal.value
+            self.samples[slot * width + index] = (value.integer if value.is_resolvable
+                                                  else UNDEFINED)
+        self.recorded += 1
+
+    def skip(self, n):
+        """Count cycles that ran without being recorded, eg. a free-running clock"""
+        self.count += n
+
+    def entries(self):
+        """Yield (cycle, (sample, ...)) for the buffered cycles, oldest first"""
+        width = len(self.handles)
+        first = max(0, self.recorded - self.size)
+        for n in range(first, self.recorded):
+            slot = n % self.size
+            yield self.cycles[slot], tuple(self.samples[slot * width:(slot + 1) * width])
+
+    def dump(self, path=None):
+        """Write the buffered cycles to a text file, returning its path"""
+        if path is None:
+            path = 'trace_%s.txt' % self.dut._name
+        with open(path, 'w') as out:
+            out.write('# %d cycles run, last %d recorded\n'
+                      % (self.count, min(self.recorded, self.size)))
+            out.write('cycle %s\n' % ' '.join(self.names))
+            for cycle, samples in self.entries():
+                out.write('%d %s\n' % (cycle, ' '.join(
+                    'x' if s == UNDEFINED else format(s, 'x') for s in samples)))
+        return path
+
+
+def configure(dut, size=DEFAULT_SIZE, signals=(), verbosity=DEFAULT_VERBOSITY):
+    """Start a new recorder for dut, sampling the given signal paths each cycle"""
+    _recorders[dut] = TraceRecorder(dut, size, signals, verbosity)
+    return _recorders[dut]
+
+
+def recorder(dut):
+    """The recorder for dut, created with the defaults on first use"""
+    if dut not in _recorders:
+        configure(dut)
+    return _recorders[dut]
+
+
+def dump_on_failure(test):
+    """Decorate a cocotb test, to dump the DUT's trace if it fails"""
+    @functools.wraps(test)
+    def wrapper(dut, *args, **kwargs):
+        try:
+            return (yield from test(dut, *args, **kwargs))
+        except (AssertionError, TestFailure, TestError):
+            if dut in _recorders:
+                path = _recorders[dut].dump()
+                dut._log.error('Trace of the last cycles written to %s' % path)
+            raise
+    return wrapper
@@ -1,3 +1,9 @@
 # Use unittest just for its assertion library:
 import unittest
 assertions = unittest.TestCase('__init__')
+
+def handle(dut, path):
+    """Look up a signal handle by dotted path below dut, eg. 'control.step'"""
+    for name in path.split('.'):
+        dut = getattr(dut, name)
+    return dut
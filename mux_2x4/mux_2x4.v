@@ -1,13 +1,16 @@
 /**
- * 2-way 4-bit mux for Memory Addresses
+ * 2-way mux for Memory Addresses, 4 bits wide by default
  * Used for switching between the PC/MAR and Manual Input
  */
 module mux_2x4
+  #(
+    parameter ADDRESS_WIDTH = 4
+    )
   (
-   input [3:0]  i_address_1,
-   input [3:0]  i_address_2,
-   input        i_input_select,
-   output [3:0] o_address
+   input [ADDRESS_WIDTH-1:0]  i_address_1,
+   input [ADDRESS_WIDTH-1:0]  i_address_2,
+   input                      i_input_select,
+   output [ADDRESS_WIDTH-1:0] o_address
    );
 
    assign o_address = i_input_select ? i_address_2 : i_address_1;
@@ -1,40 +1,56 @@
 /**
- * 4 bit program counter - PC
+ * Program counter - PC, 4 bits wide by default
  */
 module program_counter
+  #(
+    parameter ADDRESS_WIDTH = 4,
+    parameter DATA_WIDTH = 8
+    )
   (
    input        i_debug,
    // Count is reset to 0000 when i_reset goes high
    input        i_reset,
+   // The count changes on the falling edge of i_clock: it increments,
+   // or loads i_address from the bus on a jump
+   input        i_clock,
    input        i_increment,
+   input        i_jump,
+   input [ADDRESS_WIDTH-1:0] i_address,
    // Module output is tri-state; only enabled when i_enable_out is high
    input        i_enable_out,
-   // 4 bit count output to 8 bit bus
-   output [7:0] o_count
+   // Count output to the bus, zero extended to the data width
+   output [DATA_WIDTH-1:0] o_count
    );
 
    // Internal count register
-   reg [3:0]    count = 4'b0000;
-   reg [7:0]    count_buffer = 8'bzzzzzzzz;    
+   reg [ADDRESS_WIDTH-1:0] count = 0;
+   reg [DATA_WIDTH-1:0]    count_buffer = {DATA_WIDTH{1'bz}};
+   wire [DATA_WIDTH-1:0]   count_extended = {{(DATA_WIDTH-ADDRESS_WIDTH){1'b0}}, count};
    assign o_count = count_buffer;
    
-   always @(posedge i_increment) begin
-      count <= (count == 4'b1111) ? 4'b0000 : count + 4'b0001;
-      if(i_debug) $display("DEBUG: PC increment: %b",count);
+   // The controller changes the control word on the rising edge, so by
+   // the falling edge i_increment, i_jump and the bus have settled:
+   always @(negedge i_clock or posedge i_reset) begin
+      if(i_reset) begin
+         count <= 0;
+         if(i_debug) $display("DEBUG: PC reset: %b",count);
+      end else if(i_jump) begin
+         count <= i_address;
+         if(i_debug) $display("DEBUG: PC jump: %b",i_address);
+      end else if(i_increment) begin
+         // Rolls over from all ones to 0:
+         count <= count + 1'b1;
+         if(i_debug) $display("DEBUG: PC increment: %b",count);
+      end
    end
 
-   always @(i_enable_out) begin
+   always @(i_enable_out or count_extended) begin
       if(i_enable_out) begin
-         count_buffer <= {4'b0000, count};
-         if(i_debug) $display("DEBUG: PC write to bus: %b", {4'b0000, count});
+         count_buffer <= count_extended;
+         if(i_debug) $display("DEBUG: PC write to bus: %b", count_extended);
       end else begin
-         count_buffer <= 8'bzzzzzzzz;
+         count_buffer <= {DATA_WIDTH{1'bz}};
       end
    end
    
-   always @(posedge i_reset) begin
-      count <= 4'b0000;
-      if(i_debug) $display("DEBUG: PC reset: %b",count);
-   end
-   
 endmodule // program_counter
@@ -10,51 +10,63 @@ def program_counter(dut):
         assertions.assertEqual(dut.o_count.value.binstr, value, error_msg)
         
     # Test initialization
+    dut.i_jump = 0
     yield from wait()
-    assert_o_count('xxxx', 'o_count should start disconnected')
+    assert_o_count('xxxxxxxx', 'o_count should start disconnected')
 
     # Pulse the clock, nothing should change:
     yield from clock(dut)
-    assert_o_count('xxxx', 'o_count should still be disconnected')
+    assert_o_count('xxxxxxxx', 'o_count should still be disconnected')
 
     # Enable the output:
     dut.i_enable_out = 1
     yield from wait()
-    assert_o_count('0000', 'o_count should be enabled and initialized')
+    assert_o_count('00000000', 'o_count should be enabled and initialized')
 
     # Increment:
     dut.i_increment = 1
     yield from wait()
-    assert_o_count('0000', 'o_count should not increment until clock pulse')
+    assert_o_count('00000000', 'o_count should not increment until clock pulse')
     yield from clock(dut)
-    assert_o_count('0001', 'o_count should increment')
+    assert_o_count('00000001', 'o_count should increment')
     yield from clock(dut)
-    assert_o_count('0010', 'o_count should increment')
+    assert_o_count('00000010', 'o_count should increment')
     yield from clock(dut)
-    assert_o_count('0011', 'o_count should increment')
+    assert_o_count('00000011', 'o_count should increment')
 
     # Cycle without increment:
     dut.i_increment = 0
     yield from clock(dut)
-    assert_o_count('0011', 'o_count should not increment')
+    assert_o_count('00000011', 'o_count should not increment')
+
+    # Jump:
+    dut.i_address = 0b1010
+    dut.i_jump = 1
+    yield from wait()
+    assert_o_count('00000011', 'o_count should not jump until clock pulse')
+    yield from clock(dut)
+    assert_o_count('00001010', 'o_count should load the jump address')
+    dut.i_jump = 0
+    yield from clock(dut)
+    assert_o_count('00001010', 'o_count should hold after the jump')
 
     # Disable and Re-enable output:
     dut.i_enable_out = 0
     yield from wait()
-    assert_o_count('zzzz', 'o_count should disconnect')
+    assert_o_count('zzzzzzzz', 'o_count should disconnect')
     dut.i_enable_out = 1
     yield from wait()
-    assert_o_count('0011', 'o_count should re-enable')
+    assert_o_count('00001010', 'o_count should re-enable')
     
     # Reset:
     yield from reset(dut)
-    assert_o_count('0000', 'o_count should reset')
+    assert_o_count('00000000', 'o_count should reset')
 
     # Test roll-over:
     dut.i_increment = 1
     # Increment over 8 cycles:
     yield from clock(dut, 8)
-    assert_o_count('1000', 'o_count should be 8')
+    assert_o_count('00001000', 'o_count should be 8')
     # Increment over 9 cycles, rolling over the count:
     yield from clock(dut, 9)
-    assert_o_count('0001', 'o_count should roll-over back to 1')
+    assert_o_count('00000001', 'o_count should roll-over back to 1')
@@ -1,43 +1,65 @@
 /**
- * 16 Byte RAM
+ * RAM, 16 Bytes by default: 2**ADDRESS_WIDTH words of DATA_WIDTH bits
  */
 module ram_16x8
+  #(
+    parameter ADDRESS_WIDTH = 4,
+    parameter DATA_WIDTH = 8,
+    // Image to load with $readmemh, unless overridden by +ram_image=FILE:
+    parameter [8*1024-1:0] INIT_FILE = ""
+    )
   (
    input       i_debug,
    input       i_program_mode, // 0==run program, 1==manual input data
-   input [7:0] i_program_data, // dedicated programming switches for manual input
-   input [3:0] i_address, // address to read/write from/to
+   input [DATA_WIDTH-1:0] i_program_data, // dedicated programming switches for manual input
+   input [ADDRESS_WIDTH-1:0] i_address, // address to read/write from/to
    input       i_write_enable, // Enable writing (supercedes i_read_enable)
-   input       i_read_enable, // Enable reading (if neither read nor write, disconnect io_data)
-   inout [7:0] io_data         // The main wbus connection for input and output
+   input       i_read_enable, // Enable reading (if not, disconnect o_data)
+   // The main wbus connection, as separate input and tri-state output
+   // ports, as in register.v, rather than one inout:
+   input [DATA_WIDTH-1:0] i_data,
+   output [DATA_WIDTH-1:0] o_data
    );
 
-   reg [7:0]    ram [0:15];
-   assign io_data = (i_read_enable) ? ram[i_address] : 8'bzzzzzzzz;
+   reg [DATA_WIDTH-1:0] ram [0:(1<<ADDRESS_WIDTH)-1];
+   assign o_data = (i_read_enable) ? ram[i_address] : {DATA_WIDTH{1'bz}};
 
-   // For simplicity, we can initialize all of the RAM in hardware,
-   // it's only 16B. However, this does not scale well.
-   integer     index;
+   // Load the RAM image in one go, from the file given by the
+   // +ram_image plusarg or INIT_FILE, one hex word per line (see
+   // lib.memory.write_memh). With neither, RAM starts cleared.
+   reg [8*1024-1:0] image;
+   integer address;
    initial begin
-      for(index = 0; index < 16; index=index+1) begin
-         ram[index]  = 8'b00000000;
+      if(!$value$plusargs("ram_image=%s", image)) begin
+         image = INIT_FILE;
+      end
+      if(image != 0) begin
+         $readmemh(image, ram);
+      end else begin
+         for(address = 0; address < (1<<ADDRESS_WIDTH); address = address + 1) begin
+            ram[address] = 0;
+         end
       end
    end
 
-   always @(posedge i_write_enable) begin
-      if(i_program_mode) begin
-         // Write to i_address in RAM from the data found on the i_program_data bus
-         if(i_debug) $display("DEBUG: Program RAM address: %b data: %b",i_address, i_program_data);
-         ram[i_address] <= i_program_data;
-      end else begin
-         // Write to i_address in RAM from the data found on the io_data bus
-         if(i_debug) $display("DEBUG: RAM write address: %b data: %b",i_address, io_data);
-         ram[i_address] <= io_data;         
+   // A latch, as in register.v: the addressed word follows the data
+   // while i_write_enable is high.
+   always @(i_write_enable or i_program_mode or i_address or i_data or i_program_data) begin
+      if(i_write_enable) begin
+         if(i_program_mode) begin
+            // Write to i_address in RAM from the data found on the i_program_data bus
+            if(i_debug) $display("DEBUG: Program RAM address: %b data: %b",i_address, i_program_data);
+            ram[i_address] = i_program_data;
+         end else begin
+            // Write to i_address in RAM from the data found on the bus
+            if(i_debug) $display("DEBUG: RAM write address: %b data: %b",i_address, i_data);
+            ram[i_address] = i_data;
+         end
       end
    end
 
-   always @(posedge i_read_enable) begin
-      if(i_debug) $display("DEBUG: RAM read address: %b data to bus: %b",i_address, ram[i_address]);
+   always @(i_read_enable or i_address) begin
+      if(i_read_enable && i_debug) $display("DEBUG: RAM read address: %b data to bus: %b",i_address, ram[i_address]);
    end
       
 endmodule // ram_16x8
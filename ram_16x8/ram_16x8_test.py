@@ -1,18 +1,21 @@
 import cocotb
+from lib import bench
 import numbers
 import random
 from lib.util import assertions
 from lib.cycle import clock, wait, cycle, reset
+from lib.memory import load_ram, read_ram
 
 @cocotb.test()
+@bench.measure
 def ram_16x8(dut):
 
-    def assert_io_data(value, error_msg):
-        """Check the value of the data lines"""
+    def assert_o_data(value, error_msg):
+        """Check the value of the data output lines"""
         if (isinstance(value, numbers.Number)):
-            assertions.assertEqual(dut.io_data.value, value, error_msg)
+            assertions.assertEqual(dut.o_data.value, value, error_msg)
         else:
-            assertions.assertEqual(dut.io_data.value.binstr, value, error_msg)
+            assertions.assertEqual(dut.o_data.value.binstr, value, error_msg)
 
     def reset_input():
         dut.i_debug = 1
@@ -21,7 +24,7 @@ def ram_16x8(dut):
         dut.i_address.value.binstr = 'zzzz'
         dut.i_write_enable = 0
         dut.i_read_enable = 0        
-        dut.io_data.value.binstr = 'zzzzzzzz'
+        dut.i_data.value.binstr = 'zzzzzzzz'
 
         yield from wait()
 
@@ -29,13 +32,13 @@ def ram_16x8(dut):
         dut.i_address = address
         dut.i_read_enable = 1
         yield from wait()
-        assert_io_data(value, error_msg)
+        assert_o_data(value, error_msg)
         dut.i_read_enable = 0
         yield from wait()
 
     def write_data(address, data):
         dut.i_address = address
-        dut.io_data = data
+        dut.i_data = data
         yield from cycle(dut, 1, ['i_write_enable'])
 
     def program_data(address, data):
@@ -53,26 +56,33 @@ def ram_16x8(dut):
     # Initialize
     yield from reset_input()
     yield from wait()
-    assert_io_data('zzzzzzzz', 'No output should be made on initialization')
+    assert_o_data('zzzzzzzz', 'No output should be made on initialization')
 
     # Verify all RAM is cleared
     yield from reset_input()
-    for addr in range(16):
-        assert_read(addr, '00000000', 'RAM address is cleared')
+    assertions.assertEqual(read_ram(dut.ram), [0] * 16, 'RAM should be cleared')
     
     # Manually enter new RAM data
     yield from reset_input()
     data = [random.randint(0,255) for x in range(16)]
     for addr in range(16):
         yield from program_data(addr, data[addr])
-    assert_io_data('zzzzzzzz', 'No output should be available unless read is enabled')
+    assert_o_data('zzzzzzzz', 'No output should be available unless read is enabled')
 
     # Read from RAM
     yield from reset_input()
+    assertions.assertEqual(read_ram(dut.ram), data, 'RAM should hold the programmed data')
     for addr in range(16):
         assert_read(addr, data[addr])
     
-    # Write data from the io_data bus
+    # Write data from the i_data bus
     yield from reset_input()
     yield from assert_write(0b0010, 0b11001100)
 
+    # Load a whole image through the backdoor
+    yield from reset_input()
+    data = [random.randint(0,255) for x in range(16)]
+    load_ram(dut.ram, data)
+    yield from wait()
+    assertions.assertEqual(read_ram(dut.ram), data, 'RAM should hold the loaded image')
+
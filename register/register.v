@@ -1,33 +1,47 @@
 /**
- * 8 bit register
+ * Register, 8 bits wide by default
  * Used in Accumulator and B register
  */
 module register
+  #(
+    parameter DATA_WIDTH = 8
+    )
   (
    input        i_debug,
    input        i_reset, 
    input        i_load_data,
    input        i_send_data,
-   input [7:0]  i_bus,
-   output [7:0] o_bus,
-   output [7:0] o_unbuffered
+   input [DATA_WIDTH-1:0]  i_bus,
+   output [DATA_WIDTH-1:0] o_bus,
+   output [DATA_WIDTH-1:0] o_unbuffered
    );
 
-   reg [7:0]   data;
+   reg [DATA_WIDTH-1:0] data;
    
-   assign o_bus = i_send_data ? data : 8'bzzzzzzzz;
+   assign o_bus = i_send_data ? data : {DATA_WIDTH{1'bz}};
    assign o_unbuffered = data;   
 
-   always @(i_bus or posedge i_load_data) begin
-      if(i_load_data) begin
-         data <= i_bus;
+   // A latch: data follows the bus while i_load_data is high. Reset is
+   // in the same level sensitive block, so that cycle based simulators
+   // (Verilator) see a single driver of data. The assignments are
+   // blocking, as in any combinational block: Verilator keeps a delayed
+   // copy of a latch assigned non-blocking, and copies it back over a
+   // value lib.checkpoint deposits. sap.v only enables the load while
+   // the clock is low, so it never races the next control word.
+   always @(i_bus or i_load_data or i_reset) begin
+      if(i_reset) begin
+`ifdef VERILATOR
+         // Two state, so z would read as 0; and Verilator's tristate pass
+         // drops a z assignment, leaving data as it was:
+         data = 0;
+`else
+         data = {DATA_WIDTH{1'bz}};
+`endif
+      end else if(i_load_data) begin
+         data = i_bus;
          if(i_debug) $display("DEBUG: Register loaded: %b", i_bus);
       end
    end
-
-   always @(posedge i_reset) begin
-      data <= 8'bzzzzzzzz;
-   end
    
    
 endmodule // register
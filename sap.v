@@ -1,5 +1,10 @@
 /**
  * SAP-1 whole system integration
+ *
+ * RAM holds 2**ADDRESS_WIDTH words of DATA_WIDTH bits, 16 Bytes by
+ * default. An instruction word is a 4 bit opcode and an operand of the
+ * remaining DATA_WIDTH-4 bits, so operands reach all of RAM as long as
+ * DATA_WIDTH is at least ADDRESS_WIDTH+4, as it is by default.
  */
 `include "program_counter/program_counter.v"
 `include "memory_address_register/memory_address_register.v"
@@ -11,12 +16,17 @@
 `include "controller/controller.v"
 
 module sap
+  #(
+    parameter ADDRESS_WIDTH = 4,
+    parameter DATA_WIDTH = ADDRESS_WIDTH + 4,
+    parameter RAM_INIT_FILE = "" // $readmemh image, see ram_16x8
+    )
   (
    input        i_clock,
    input        i_reset,
    input        i_program_mode, //0=Execution Mode 1=Program Mode
-   input [3:0]  i_program_address, //The address to program
-   input [7:0]  i_program_data, //The data to program
+   input [ADDRESS_WIDTH-1:0] i_program_address, //The address to program
+   input [DATA_WIDTH-1:0] i_program_data, //The data to program
    input        i_program_write, //Program commit!
    // Debug flags per unit
    input        i_debug_pc,
@@ -30,7 +40,7 @@ module sap
    input        i_debug_control,
    input        i_debug_out,
    //Output Register - light up seven segment or whatever
-   output [7:0] o_display 
+   output [DATA_WIDTH-1:0] o_display 
    );
 
    // Control-Sequencer output signals
@@ -51,38 +61,68 @@ module sap
    wire         ctl_program_counter_jump;   
    
    // Component wires
-   wire [7:0]   bus; // Main system bus
-   wire [3:0]   mar_address; //Connects to 2 input Mux
-   wire [3:0]   ram_address; //Connects from mux into RAM
+   wire [DATA_WIDTH-1:0] bus; // Main system bus
+   wire [DATA_WIDTH-1:0] pc_out; //Bus drivers, each tri-state:
+   wire [DATA_WIDTH-1:0] ram_out;
+   wire [DATA_WIDTH-5:0] ir_address;
+   wire [DATA_WIDTH-1:0] register_A_out;
+   wire [DATA_WIDTH-1:0] alu_out;
+   wire [ADDRESS_WIDTH-1:0] mar_address; //Connects to 2 input Mux
+   wire [ADDRESS_WIDTH-1:0] ram_address; //Connects from mux into RAM
    wire [3:0]   opcode; //Connects from IR to Controller
-   wire [7:0]   alu_A_in; //Connects from Register A to ALU
-   wire [7:0]   alu_B_in; //Connects from Register B to ALU
+   wire [DATA_WIDTH-1:0] alu_A_in; //Connects from Register A to ALU
+   wire [DATA_WIDTH-1:0] alu_B_in; //Connects from Register B to ALU
    wire         alu_flag_zero; //Zero result flag from ALU to Controller
    wire         alu_flag_overflow; //Overflow result flag from ALU to Controller
 
+   // MAR, IR, A, B, OUT and the RAM are latches, loading from the bus
+   // while enabled. They are enabled only while the clock is low, the
+   // second half of each cycle: the enables then fall with the rising
+   // edge itself, before the controller's new control word (a
+   // non-blocking update on that edge) can change what drives the bus,
+   // so no latch can take the next cycle's bus value.
+   wire         load = !i_clock;
+
    // RAM should respond to control signals and program mode:
-   wire         ram_write = ctl_ram_in || i_program_write;
+   wire         ram_write = (ctl_ram_in && load) || i_program_write;
    wire         ram_clock = i_clock || i_program_write;
+
+   // The bus is driven from one unit at a time, picked by the controller,
+   // rather than by every unit sharing one tri-state net: cycle based
+   // simulators (Verilator) do not resolve multiple drivers. Nothing
+   // enabled leaves it floating. The IR's operand is zero extended, like
+   // the PC's count, so LDI loads a defined value into A. More than one
+   // enable at a time is contention (see lib/bus_monitor.py), where the
+   // first of them wins.
+   assign bus = ctl_program_counter_out ? pc_out :
+                ctl_ram_out ? ram_out :
+                ctl_instruction_out ? {4'b0000, ir_address} :
+                ctl_register_A_out ? register_A_out :
+                ctl_alu_out ? alu_out :
+                {DATA_WIDTH{1'bz}};
    
-   program_counter pc 
+   program_counter #(.ADDRESS_WIDTH(ADDRESS_WIDTH), .DATA_WIDTH(DATA_WIDTH)) pc
      (
       .i_debug(i_debug_pc),
       .i_reset(i_reset),
+      .i_clock(i_clock),
       .i_increment(ctl_program_counter_increment),
+      .i_jump(ctl_program_counter_jump),
+      .i_address(bus[ADDRESS_WIDTH-1:0]),
       .i_enable_out(ctl_program_counter_out),
-      .o_count(bus)
+      .o_count(pc_out)
       );
 
-   memory_address_register mar
+   memory_address_register #(.ADDRESS_WIDTH(ADDRESS_WIDTH)) mar
      (
       .i_debug(i_debug_mar),
       .i_reset(i_reset),
-      .i_enable_in(ctl_memory_address_in),
-      .i_address(bus[3:0]),
+      .i_enable_in(ctl_memory_address_in && load),
+      .i_address(bus[ADDRESS_WIDTH-1:0]),
       .o_address(mar_address)
       );
 
-   mux_2x4 mar_mux
+   mux_2x4 #(.ADDRESS_WIDTH(ADDRESS_WIDTH)) mar_mux
      (
       .i_address_1(mar_address),
       .i_address_2(i_program_address),
@@ -90,7 +130,8 @@ module sap
       .o_address(ram_address)
       );
 
-   ram_16x8 ram
+   ram_16x8 #(.ADDRESS_WIDTH(ADDRESS_WIDTH), .DATA_WIDTH(DATA_WIDTH),
+              .INIT_FILE(RAM_INIT_FILE)) ram
      (
       .i_debug(i_debug_ram),
       .i_program_mode(i_program_mode),
@@ -98,57 +139,61 @@ module sap
       .i_address(ram_address),
       .i_write_enable(ram_write),
       .i_read_enable(ctl_ram_out),
-      .io_data(bus)
+      .i_data(bus),
+      .o_data(ram_out)
       );
    
-   instruction_register ir
+   instruction_register #(.DATA_WIDTH(DATA_WIDTH)) ir
      (
       .i_debug(i_debug_ir),
       .i_reset(i_reset),
-      .i_load_instruction(ctl_instruction_in),
+      .i_load_instruction(ctl_instruction_in && load),
       .i_send_address(ctl_instruction_out),
       .i_bus(bus),
       .o_opcode(opcode),
-      .o_address(bus[3:0])
+      .o_address(ir_address)
       );
 
-   register register_A
+   register #(.DATA_WIDTH(DATA_WIDTH)) register_A
      (
       .i_debug(i_debug_register_A),
       .i_reset(i_reset),
-      .i_load_data(ctl_register_A_in),
+      .i_load_data(ctl_register_A_in && load),
       .i_send_data(ctl_register_A_out),
       .i_bus(bus),
-      .o_bus(bus),
+      .o_bus(register_A_out),
       .o_unbuffered(alu_A_in)
       );
 
-   register register_B
+   register #(.DATA_WIDTH(DATA_WIDTH)) register_B
      (
       .i_debug(i_debug_register_B),
       .i_reset(i_reset),
-      .i_load_data(ctl_register_B_in),
+      .i_load_data(ctl_register_B_in && load),
+      .i_send_data(1'b0),
       .i_bus(bus),
       .o_bus(), // Register B only outputs unbuffered, to the ALU.
       .o_unbuffered(alu_B_in)
       );
 
-   alu alu
+   alu #(.DATA_WIDTH(DATA_WIDTH)) alu
      (
+      .i_clock(i_clock),
       .i_a(alu_A_in),
       .i_b(alu_B_in),
       .i_subtract(ctl_alu_subtract),
       .i_send_result(ctl_alu_out),
       .o_flag_overflow(alu_flag_overflow),
       .o_flag_zero(alu_flag_zero),
-      .o_bus(bus)
+      .o_bus(alu_out)
       );
 
-   register register_OUT
+   register #(.DATA_WIDTH(DATA_WIDTH)) register_OUT
      (
       .i_debug(i_debug_out),
       .i_reset(i_reset),
-      .i_load_data(ctl_register_output_in),
+      .i_load_data(ctl_register_output_in && load),
+      .i_send_data(1'b0),
       .i_bus(bus),
       .o_bus(), // Register OUT displays unbuffered data to the display
       .o_unbuffered(o_display)
@@ -176,7 +221,9 @@ module sap
       .o_register_output_in(ctl_register_output_in),
       .o_program_counter_increment(ctl_program_counter_increment),
       .o_program_counter_out(ctl_program_counter_out),
-      .o_program_counter_jump(ctl_program_counter_jump)
+      .o_program_counter_jump(ctl_program_counter_jump),
+      .o_register_flags_in(), // The ALU latches its flags with its result
+      .o_step()
       );
 
    always @(posedge i_reset) begin
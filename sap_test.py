@@ -1,36 +1,66 @@
+import os
 import cocotb
+from lib import assembler, bench, checkpoint, farm, hybrid
 from lib.util import assertions
-from lib.cycle import clock, wait, cycle, reset
+from lib.bundle import SignalBundle
+from lib.bus_monitor import BusMonitor
+from lib.capture import Capture
+from lib.corpus import Corpus
+from lib.coverage import Collector
+from lib.cycle import clock, wait, cycle, reset, run_until_halt
+from lib.memory import load_ram, read_ram
+from lib.program_profiler import ProgramProfiler
+from lib.scoreboard import Scoreboard
+
+# The scoreboard checks every cycle, so the text debug output is off
+# unless asked for, eg. `make SAP_DEBUG=1`
+DEBUG = bool(os.environ.get('SAP_DEBUG'))
+# Binary capture of the bus and control signals every cycle, read with
+# lib.capture.TraceFile, eg. `make SAP_CAPTURE=sap.trace`
+CAPTURE = os.environ.get('SAP_CAPTURE')
+# Functional coverage file to write, see lib/coverage.py:
+COVERAGE = os.environ.get('SAP_COVERAGE')
+# Cycles per instruction report to write, see lib/program_profiler.py:
+PROGRAM_PROFILE = os.environ.get('SAP_PROGRAM_PROFILE')
+# The bus monitor is always on; its per-cycle records are only written
+# out if asked for, see lib/bus_monitor.py:
+BUS_RECORDS = os.environ.get('SAP_BUS_RECORDS')
+
+# Each component has a seperate debug line to selectively enable:
+DEBUG_SIGNALS = ('i_debug_pc', 'i_debug_mar', 'i_debug_ir', 'i_debug_ram',
+                 'i_debug_bus', 'i_debug_control', 'i_debug_out',
+                 'i_debug_register_A', 'i_debug_register_B')
+PROGRAM_SIGNALS = ('i_program_mode', 'i_program_address', 'i_program_data',
+                   'i_program_write')
+
+PROGRAM = assembler.assemble("""
+        LDA 9   ; 16
+        ADD 0xE ; 16+127=143
+        SUB 0xD ; 143-64=79
+        OUT     ; Displays 79
+        HLT
+        .org 9
+        .byte 16
+        .org 0xD
+        .byte 64, 127
+""")
 
 @cocotb.test()
+@bench.measure
 def sap(dut):
 
     def assert_o_display(value, error_msg='Unexpected display value'):
         """Check the display out value"""
         assertions.assertEqual(dut.o_display.value.binstr, value, error_msg)
 
+    debug = SignalBundle(dut, DEBUG_SIGNALS)
+    program_inputs = SignalBundle(dut, PROGRAM_SIGNALS)
+
     def reset_input():
-        dut.i_program_mode = 0
-        dut.i_program_address = 0b0000
-        dut.i_program_data = 0b00000000
-        dut.i_program_write = 0
-        # Each component has a seperate debug line to selectively enable:
-        dut.i_debug_pc = True
-        dut.i_debug_mar = True
-        dut.i_debug_ir = True
-        dut.i_debug_ram = True
-        dut.i_debug_bus = True
-        dut.i_debug_control = True
-        dut.i_debug_out = True
-        dut.i_debug_register_A = True
-        dut.i_debug_register_B = True
+        program_inputs.write(0)
+        debug.write_all(DEBUG)
         yield from wait()
 
-    def program_ram(address, data):
-        dut.i_program_address = address
-        dut.i_program_data = data
-        yield from cycle(dut, 1, ('i_program_write',))
-
     def reset():
         yield from reset_input()
         dut.i_reset = 1
@@ -40,34 +70,114 @@ def sap(dut):
 
     ### Total system reset:
     yield from reset()
+    bus_monitor = BusMonitor(dut, BUS_RECORDS)
+    bus_monitor.start()
+    if CAPTURE:
+        capture = Capture(dut, CAPTURE)
+        capture.start()
+    if COVERAGE:
+        collector = Collector(dut)
+        collector.start()
+    if PROGRAM_PROFILE:
+        profiler = ProgramProfiler(dut)
+        profiler.start()
 
-    ### Test program mode:
-    dut.i_program_mode = 1
-    # LDA 9 (=16)
-    yield from program_ram(0b0000,0b00011001)
-    # ADD E (16+127=143)
-    yield from program_ram(0b0001,0b00101110)
-    # SUB D (143-64=79)
-    yield from program_ram(0b0010,0b00111101)    
-    # OUT (Displays 79)
-    yield from program_ram(0b0011,0b11100000)
-    # RAM address 9 = 16
-    yield from program_ram(0b1001,0b00010000)
-    # RAM address E = 127
-    yield from program_ram(0b1110,0b01111111)
-    # RAM address D = 64
-    yield from program_ram(0b1101,0b01000000)
+    ### Load the program straight into RAM:
+    program = PROGRAM
+    load_ram(dut.ram.ram, program)
+    yield from wait()
+    assertions.assertEqual(read_ram(dut.ram.ram), program, 'RAM should hold the program')
     
     ### Test execution
     yield from reset_input()
-    ### Wait for LDA - 4 cycles
-    yield from clock(dut, 4)
-    ### Wait for ADD - 5 cycles
-    yield from clock(dut, 5)
-    ### Wait for SUB - 5 cycles
-    yield from clock(dut, 5)
-    ### Wait for OUT - 3 cycles
-    yield from clock(dut, 3)
+    # Reset and programmed, for later runs to start from:
+    programmed = checkpoint.capture(dut)
 
-    
+    def run_program():
+        # Check the DUT against the golden model every cycle of the run:
+        scoreboard = Scoreboard(dut)
+        monitor = scoreboard.start()
+        ### Run until HLT: LDA 4 + ADD 5 + SUB 5 + OUT 3 + HLT 3 cycles
+        cycles = yield from run_until_halt(dut, max_cycles=100)
+        assertions.assertEqual(cycles, 20, 'Program should halt after 20 cycles')
+        scoreboard.check()
+        monitor.kill()
+
+    yield from run_program()
     assert_o_display('01001111', 'Output should be 79')
+
+    ### Branch from the programmed state, with RAM address E = 0 (16+0-64=208):
+    ram = list(programmed.ram)
+    ram[0b1110] = 0
+    checkpoint.restore(dut, programmed._replace(ram=tuple(ram)))
+    yield from wait()
+    yield from run_program()
+    assert_o_display('11010000', 'Output should be 208')
+    bus_monitor.close()
+    bus_monitor.check()
+    if CAPTURE:
+        capture.close()
+    if COVERAGE:
+        collector.stop()
+        collector.coverage.save(COVERAGE)
+    if PROGRAM_PROFILE:
+        profiler.stop()
+        with open(PROGRAM_PROFILE, 'w') as report:
+            profiler.report(report)
+
+@cocotb.test()
+@bench.measure
+def sap_hybrid(dut):
+    """Fast-forward LDA and ADD in the ISA model, then run the rest in the RTL"""
+    SignalBundle(dut, DEBUG_SIGNALS).write(0)
+    SignalBundle(dut, PROGRAM_SIGNALS).write(0)
+    dut.i_clock = 0
+    yield from reset(dut)
+    result = yield from hybrid.run(dut, PROGRAM, instructions=2, window=100, resume=False)
+    # LDA 4 + ADD 5 cycles in the model, then SUB 5 + OUT 3 + HLT 3 in the RTL:
+    assertions.assertEqual(result.model_cycles, 9, 'Model should run LDA and ADD')
+    assertions.assertEqual(result.rtl_cycles, 11, 'RTL should run SUB, OUT and HLT')
+    assertions.assertTrue(result.halted, 'Program should halt in the RTL')
+    assertions.assertEqual(dut.o_display.value.integer, 79, 'Output should be 79')
+
+    ### Hand back to the model after a window of one instruction:
+    yield from reset(dut)
+    result = yield from hybrid.run(dut, PROGRAM, instructions=2, window=5)
+    assertions.assertEqual(result.rtl_cycles, 5, 'RTL should run just SUB')
+    assertions.assertEqual((result.cycles, result.halted, result.state.out), (20, True, 79),
+                           'Model should finish the program')
+
+@cocotb.test(skip=not os.environ.get('SAP_FARM_IMAGES'))
+def program_farm(dut):
+    """Run every RAM image in $SAP_FARM_IMAGES, see lib/farm.py"""
+    SignalBundle(dut, DEBUG_SIGNALS).write(0)
+    SignalBundle(dut, PROGRAM_SIGNALS).write(0)
+    dut.i_clock = 0
+    yield from reset(dut)
+    yield from wait()
+    # Memory-mapped, so a corpus of any size costs nothing to open:
+    images = Corpus(os.environ['SAP_FARM_IMAGES'])
+    max_cycles = int(os.environ.get('SAP_FARM_MAX_CYCLES', farm.DEFAULT_MAX_CYCLES))
+    # Random programs are checked against the model by lib.fuzz, so bus
+    # errors are reported, but do not stop the run:
+    bus_monitor = BusMonitor(dut, BUS_RECORDS, strict=False)
+    bus_monitor.start()
+    if COVERAGE:
+        collector = Collector(dut)
+        collector.start()
+    if PROGRAM_PROFILE:
+        profiler = ProgramProfiler(dut)
+        profiler.start()
+    with open(os.environ['SAP_FARM_RESULTS'], 'w') as results:
+        yield from farm.run(dut, images, results, max_cycles)
+    bus_monitor.close()
+    if bus_monitor.errors:
+        dut._log.warning('%d bus errors in %d cycles, the first: %s'
+                         % (bus_monitor.error_count, bus_monitor.cycle, bus_monitor.errors[0]))
+    if COVERAGE:
+        collector.stop()
+        collector.coverage.save(COVERAGE)
+    if PROGRAM_PROFILE:
+        profiler.stop()
+        with open(PROGRAM_PROFILE, 'w') as report:
+            profiler.report(report)